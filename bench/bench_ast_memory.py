@@ -0,0 +1,89 @@
+import argparse
+import gc
+import os
+import tracemalloc
+from enum import Enum
+
+from code import ast as astModule
+from code.cfg import OutputMode
+from code.listener import ASTListener
+from code.parser import getParserWorker
+from code.walker import IterativeParseTreeWalker
+
+
+def countNodes(root):
+    # number of code.ast objects reachable from root, by class
+    counts = {}
+    seen = set()
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, (list, tuple)):
+            stack.extend(node)
+            continue
+        if isinstance(node, dict):
+            stack.extend(node.values())
+            continue
+        if type(node).__module__ != astModule.__name__ or isinstance(node, Enum) or id(node) in seen:
+            continue
+        seen.add(id(node))
+        counts[type(node).__name__] = counts.get(type(node).__name__, 0) + 1
+        if isinstance(node, astModule.Pos):
+            continue
+        for name in attributeNames(node):
+            stack.append(getattr(node, name, None))
+    return counts
+
+
+def attributeNames(node):
+    if hasattr(node, "__dict__"):
+        return list(vars(node))
+    return [name for cls in type(node).__mro__ for name in getattr(cls, "__slots__", ())]
+
+
+def javaFiles(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                for file in sorted(files):
+                    if file.endswith(".java"):
+                        yield os.path.join(root, file)
+        else:
+            yield path
+
+
+def main(argv=None):
+    argParser = argparse.ArgumentParser(description="Memory held by the AST of java files, in bytes per AST node.")
+    argParser.add_argument("paths", nargs="*", default=["javasamples"], help=".java files or directories")
+    args = argParser.parse_args(argv)
+
+    worker = getParserWorker(True)
+    asts = []
+    total = 0
+    counts = {}
+
+    for path in javaFiles(args.paths):
+        # the parse tree is built first, only the tree walk (the AST) is measured
+        parseTree = worker.parse(path)
+        gc.collect()
+        tracemalloc.start()
+        listener = ASTListener(os.devnull, OutputMode.NONE)
+        IterativeParseTreeWalker().walk(listener, parseTree)
+        del parseTree
+        gc.collect()
+        total += tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        asts.append(listener.ast)
+        for name, count in countNodes(listener.ast).items():
+            counts[name] = counts.get(name, 0) + count
+
+    nodes = sum(counts.values())
+    print(f"{len(asts)} files, {nodes} AST nodes ({counts.get('Pos', 0)} Pos), {total} bytes")
+    print(f"{total / max(nodes, 1):.1f} bytes per AST node")
+    for name, count in sorted(counts.items(), key=lambda c: -c[1]):
+        print(f"  {name:<16} {count:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import argparse
+import tempfile
+import time
+import tracemalloc
+
+import networkx  # imported here, so the import is not counted as memory of the first graph
+
+from code.ast import *
+from code.cfg import OutputMode, SourceLevelCFG
+
+
+def syntheticMethod(statements):
+    # a single method with `statements` top-level statements: mostly plain statements,
+    # with an if/else and a while loop every few statements so the CFG has real branches.
+    method = Method(Pos(1, 0), "synthetic", "void")
+    method.scope = "Synthetic"
+    method.bodyBlock = BlockStmt(Pos(1, 0))
+
+    for n in range(statements):
+        pos = Pos(n + 2, 8)
+        if n % 10 == 5:
+            ifStmt = IfStmt(pos, BinaryExpr(pos, "x", ">", str(n)))
+            ifStmt.bodyBlock = BlockStmt(pos)
+            ifStmt.bodyBlock.body.append(ExpressionStmt(pos, AssignExpr(pos, "", "x", BinaryExpr(pos, "x", "-", "1"))))
+            ifStmt.elseBlock = BlockStmt(pos)
+            ifStmt.elseBlock.body.append(ExpressionStmt(pos, AssignExpr(pos, "", "x", BinaryExpr(pos, "x", "+", "1"))))
+            method.bodyBlock.body.append(ifStmt)
+        elif n % 10 == 9:
+            whileStmt = WhileStmt(pos, BinaryExpr(pos, "x", "<", str(n)))
+            whileStmt.bodyBlock = BlockStmt(pos)
+            whileStmt.bodyBlock.body.append(ExpressionStmt(pos, UnaryExpr(pos, UnaryExpr.Type.POST_INC, "x")))
+            method.bodyBlock.body.append(whileStmt)
+        elif n == 0:
+            method.bodyBlock.body.append(DeclStmt(pos, Field(pos, "x", "int", Field.Type.LOCAL_VAR, "0")))
+        else:
+            method.bodyBlock.body.append(ExpressionStmt(pos, AssignExpr(pos, "", "x", BinaryExpr(pos, "x", "*", str(n)))))
+
+    ast = AST()
+    ast.decls.append(method)
+    return ast
+
+
+def allocatedKiB(build):
+    # memory held by the object returned by build()
+    tracemalloc.start()
+    obj = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del obj
+    return size / 1024
+
+
+def main(argv=None):
+    argParser = argparse.ArgumentParser(description="CFG construction time of one synthetic method, by method length.")
+    argParser.add_argument("sizes", nargs="*", type=int, default=[625, 1250, 2500, 5000])
+    args = argParser.parse_args(argv)
+
+    # construction (genMethodCFG) and the final clean-up (prepareFinalCFG) are timed separately:
+    # construction should grow linearly with the method length.
+    # the memory of the method graph is compared with the same graph as an nx.DiGraph.
+    print(f"{'statements':>10} {'build s':>10} {'us/statement':>14} {'prepare s':>10} "
+          f"{'graph KiB':>10} {'nx KiB':>10}")
+    with tempfile.TemporaryDirectory() as outputDir:
+        for size in args.sizes:
+            ast = syntheticMethod(size)
+            cfg = SourceLevelCFG(ast, outputDir, OutputMode.NONE)
+            cfg.reset()
+
+            start = time.perf_counter()
+            cfg.genMethodCFG(ast.decls[0])
+            build = time.perf_counter() - start
+
+            graphKiB = allocatedKiB(cfg.CFG.copy)
+            networkxKiB = allocatedKiB(cfg.CFG.toNetworkx)
+
+            start = time.perf_counter()
+            cfg.prepareFinalCFG()
+            prepare = time.perf_counter() - start
+            print(f"{size:>10} {build:>10.3f} {build / size * 1e6:>14.1f} {prepare:>10.3f} "
+                  f"{graphKiB:>10.0f} {networkxKiB:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
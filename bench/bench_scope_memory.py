@@ -0,0 +1,58 @@
+import argparse
+import gc
+import os
+import tempfile
+import tracemalloc
+
+from bench.bench_ast_memory import countNodes
+from bench.synth import SyntheticJavaGenerator
+from code.cfg import OutputMode
+from code.listener import ASTListener
+from code.parser import getParserWorker
+from code.walker import IterativeParseTreeWalker
+
+
+def measure(worker, path, stream):
+    # (peak bytes, bytes still held once the file is done, AST nodes still reachable from the AST)
+    # of the tree walk and the CFG generation of path. the streaming walk prunes the parse tree,
+    # so every measure parses the file again (the parse itself is not measured).
+    parseTree = worker.parse(path)
+    gc.collect()
+    tracemalloc.start()
+    listener = ASTListener(os.devnull, OutputMode.NONE, stream=stream)
+    IterativeParseTreeWalker().walk(listener, parseTree)
+    peak = tracemalloc.get_traced_memory()[1]
+    del parseTree
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return peak, held, countNodes(listener.ast)
+
+
+def main(argv=None):
+    argParser = argparse.ArgumentParser(description="Memory held by the scopes of a file with thousands of blocks, "
+                                                    "with and without streaming the methods to the CFG generation.")
+    argParser.add_argument("--methods", type=int, default=100,
+                           help="methods of the generated file, about 17 blocks each (default: 100)")
+    argParser.add_argument("--statements", type=int, default=40, help="statements per method (default: 40)")
+    argParser.add_argument("--depth", type=int, default=3, help="maximum nesting of for/while/if (default: 3)")
+    argParser.add_argument("--seed", type=int, default=0)
+    args = argParser.parse_args(argv)
+
+    generator = SyntheticJavaGenerator(seed=args.seed, methods=args.methods, statements=args.statements,
+                                       depth=args.depth)
+    worker = getParserWorker(True)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "Blocks.java")
+        with open(path, "w") as f:
+            f.write(generator.genClass("Blocks"))
+
+        print(f"{'stream':<8} {'peak KiB':>10} {'held KiB':>10} {'blocks held':>12} {'AST nodes held':>15}")
+        for stream in (None, "inline"):
+            peak, held, counts = measure(worker, path, stream)
+            print(f"{stream or 'none':<8} {peak / 1024:>10.0f} {held / 1024:>10.0f} {counts.get('BlockStmt', 0):>12} "
+                  f"{sum(counts.values()):>15}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import argparse
+import os
+import pickle
+import time
+
+from code.cfg import OutputMode
+from code.listener import ASTListener
+from code.parser import getParserWorker
+from code.serialize import dumpAST, loadAST
+from code.walker import IterativeParseTreeWalker
+
+
+def javaFiles(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                for file in sorted(files):
+                    if file.endswith(".java"):
+                        yield os.path.join(root, file)
+        else:
+            yield path
+
+
+def main(argv=None):
+    argParser = argparse.ArgumentParser(description="Time parsing a java file against loading its serialized AST.")
+    argParser.add_argument("paths", nargs="*", default=["javasamples"], help=".java files or directories")
+    argParser.add_argument("--repeat", type=int, default=5, help="best of REPEAT loads (default: 5)")
+    args = argParser.parse_args(argv)
+
+    worker = getParserWorker(True)
+    total = {"parse": 0.0, "dump": 0.0, "load": 0.0, "bytes": 0, "pickle": 0}
+    print(f"{'file':<24} {'parse s':>9} {'load s':>9} {'speedup':>9} {'bytes':>8} {'pickle':>8}")
+    for path in javaFiles(args.paths):
+        # the parse of a warm parser (the second one), like in a long batch run
+        worker.parse(path)
+        start = time.perf_counter()
+        listener = ASTListener(os.devnull, OutputMode.NONE)
+        listener.exitCompilationUnit = lambda ctx: None  # no CFG generation
+        IterativeParseTreeWalker().walk(listener, worker.parse(path))
+        parse = time.perf_counter() - start
+
+        start = time.perf_counter()
+        data = dumpAST(listener.ast)
+        dump = time.perf_counter() - start
+
+        load = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            loadAST(data)
+            load = min(load, time.perf_counter() - start)
+
+        try:
+            pickled = len(pickle.dumps(listener.ast, protocol=pickle.HIGHEST_PROTOCOL))
+        except RecursionError:  # deeply nested expressions
+            pickled = 0
+
+        print(f"{os.path.basename(path):<24} {parse:>9.4f} {load:>9.4f} {parse / load:>8.0f}x {len(data):>8} {pickled:>8}")
+        for name, value in (("parse", parse), ("dump", dump), ("load", load), ("bytes", len(data)), ("pickle", pickled)):
+            total[name] += value
+
+    print(f"total: parse {total['parse']:.3f} s, dump {total['dump']:.4f} s, load {total['load']:.4f} s "
+          f"({total['parse'] / max(total['load'], 1e-9):.0f}x), {total['bytes']} bytes ({total['pickle']} pickled)")
+
+
+if __name__ == "__main__":
+    main()
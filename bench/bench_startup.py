@@ -0,0 +1,61 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (name, python arguments): what a run pays before its first file
+COMMANDS = [
+    ("import main", ["-c", "import main"]),
+    ("main.py --help", ["main.py", "--help"]),
+    ("import parser", ["-c", "import code.parser"]),
+]
+
+
+def importTimes(stderr):
+    # {module: cumulative microseconds} of the output of python -X importtime
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        try:
+            times[fields[2].strip()] = int(fields[1])
+        except ValueError:  # the header
+            pass
+    return times
+
+
+def measure(args, repeat):
+    # best wall time of repeat runs, and the import times of the last one
+    best = float("inf")
+    stderr = ""
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, "-X", "importtime", *args], cwd=ROOT, capture_output=True, text=True)
+        best = min(best, time.perf_counter() - start)
+        stderr = result.stderr
+    return best, importTimes(stderr)
+
+
+def main(argv=None):
+    argParser = argparse.ArgumentParser(description="Time the startup of the tool and its slowest imports "
+                                                    "(python -X importtime).")
+    argParser.add_argument("--repeat", type=int, default=5, help="best of REPEAT runs (default: 5)")
+    argParser.add_argument("--top", type=int, default=8, help="number of slowest imports shown (default: 8)")
+    args = argParser.parse_args(argv)
+
+    for name, commandArgs in COMMANDS:
+        seconds, times = measure(commandArgs, args.repeat)
+        heavy = [m for m in ("gen.Java20Parser", "gen.Java20Lexer", "graphviz", "networkx") if m in times]
+        print(f"{name:<16} {seconds * 1000:>8.1f} ms   heavy modules imported: {', '.join(heavy) or 'none'}")
+        # the cumulative time of the modules imported by the tool or its dependencies, the slowest first
+        top = sorted(times.items(), key=lambda item: item[1], reverse=True)[:args.top]
+        for module, microseconds in top:
+            print(f"    {module:<40} {microseconds / 1000:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
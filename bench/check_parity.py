@@ -0,0 +1,128 @@
+import argparse
+import os
+import sys
+from enum import Enum
+
+from code import ast as astModule
+from code.cfg import OutputMode
+from code.listener import ASTListener
+from code.parser import getParserWorker
+from code.splitter import MethodSplitter
+from code.visitor import ASTVisitor
+from code.walker import IterativeParseTreeWalker
+
+
+class Text(str):
+    # a piece of the dump, as opposed to the str values of the AST
+    pass
+
+
+def dumpAST(root, out):
+    # a canonical text of the AST, every attribute of every node in a fixed order
+    # (with an explicit stack: the expressions of long concatenations are deeply nested)
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if type(node) == Text:
+            out.append(node)
+        elif isinstance(node, astModule.Pos):
+            out.append(f"@{node.line}:{node.column}")
+        elif node is None or isinstance(node, (str, int, float, bool)):
+            out.append(repr(node))
+        elif isinstance(node, Enum):
+            out.append(str(node))
+        else:
+            if isinstance(node, (list, tuple)):
+                items = [Text("[")]
+                for item in node:
+                    items += [item, Text(",")]
+                items.append(Text("]"))
+            elif isinstance(node, dict):
+                items = [Text("{")]
+                for key, value in node.items():
+                    items += [key, Text(":"), value, Text(",")]
+                items.append(Text("}"))
+            else:
+                items = [Text(type(node).__name__ + "(")]
+                for name in type(node).__slots__:
+                    value = getattr(node, name)
+                    if name == "scopes" and value is not None:
+                        # the blocks of the scopes of a method are dumped where they are used
+                        value = list(value)
+                    items += [Text(name + "="), value, Text(",")]
+                items.append(Text(")"))
+            stack.extend(reversed(items))
+
+
+def canonicalText(ast):
+    # the scopes of the AST are dumped by name only, their blocks are dumped where they are used
+    out = []
+    dumpAST(ast.package, out)
+    dumpAST(list(ast.scopes), out)
+    dumpAST(ast.decls, out)
+    return "".join(out)
+
+
+def buildAST(builder, parseTree):
+    # the AST and the number of statements the listener couldn't place, with builder "listener" or "visitor"
+    listener = ASTListener(os.devnull, OutputMode.NONE)
+    listener.exitCompilationUnit = lambda ctx: None  # no CFG generation
+    if builder == "visitor":
+        ASTVisitor(listener).visit(parseTree)
+    else:
+        IterativeParseTreeWalker().walk(listener, parseTree)
+    return listener.ast, listener.state.PopFailures
+
+
+def javaFiles(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                for file in sorted(files):
+                    if file.endswith(".java"):
+                        yield os.path.join(root, file)
+        else:
+            yield path
+
+
+def main(argv=None):
+    argParser = argparse.ArgumentParser(description="Check that ASTVisitor (and MethodSplitter with --split) "
+                                                    "builds the same AST as ASTListener.")
+    argParser.add_argument("paths", nargs="*", default=["javasamples"], help=".java files or directories")
+    argParser.add_argument("--split", action="store_true",
+                           help="also compare the AST stitched by MethodSplitter, for the files it can split")
+    args = argParser.parse_args(argv)
+
+    worker = getParserWorker(True)
+    files = 0
+    failed = 0
+    for path in javaFiles(args.paths):
+        files += 1
+        parseTree = worker.parse(path)
+        results = {}
+        for builder in ("listener", "visitor"):
+            try:
+                ast, popFailures = buildAST(builder, parseTree)
+                results[builder] = f"{canonicalText(ast)} popFailures={popFailures}"
+            except Exception as e:
+                results[builder] = f"error: {e!r}"
+
+        if args.split:
+            splitter = MethodSplitter()
+            ast = splitter.buildAST(path)
+            if ast is not None:
+                results["split"] = f"{canonicalText(ast)} popFailures={splitter.popFailures}"
+
+        different = [builder for builder in results if results[builder] != results["listener"]]
+        if different:
+            failed += 1
+            print(f"DIFFERENT {path} ({', '.join(different)})")
+        else:
+            print(f"same      {path}{'' if len(results) > 2 or not args.split else ' (not split)'}")
+
+    print(f"{files} files, {failed} different")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
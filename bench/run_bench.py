@@ -0,0 +1,84 @@
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+
+from bench.synth import addCorpusArguments, corpusOptions, writeCorpus
+from code.cfg import OutputMode
+from code.timing import totalPhases
+from main import generate_directory_cfg
+
+
+def peakRssKiB(statuses):
+    # ru_maxrss is in KiB on Linux (bytes on macOS), the workers report theirs in the file status
+    scale = 1024 if sys.platform == "darwin" else 1
+    return {
+        "parent": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // scale,
+        "workers": max((s["max_rss"] for s in statuses), default=0) // scale,
+    }
+
+
+def main(argv=None):
+    argParser = argparse.ArgumentParser(description="Benchmark the whole pipeline on a synthetic Java corpus.")
+    addCorpusArguments(argParser)
+    argParser.add_argument("--corpus", default=None, metavar="DIR",
+                           help="benchmark the .java files of DIR instead of a generated corpus")
+    argParser.add_argument("-j", "--workers", type=int, default=1)
+    argParser.add_argument("--start-method", default=None)
+    argParser.add_argument("--sll", action="store_true")
+    argParser.add_argument("--warm-up", default=None, metavar="DIR")
+    argParser.add_argument("--builder", choices=["listener", "visitor"], default="listener")
+    argParser.add_argument("--output-mode", choices=[m.value for m in OutputMode], default=OutputMode.JSON.value)
+    argParser.add_argument("--report", default=None, metavar="FILE",
+                           help="also write the results as json to FILE, to compare versions")
+    args = argParser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workDir:
+        corpus = args.corpus
+        statements = None
+        if corpus is None:
+            corpus = os.path.join(workDir, "corpus")
+            statements = writeCorpus(corpus, args.files, args.seed, **corpusOptions(args))
+
+        start = time.perf_counter()
+        runOptions = {"twoStage": args.sll, "outputMode": OutputMode(args.output_mode), "builder": args.builder}
+        statuses = generate_directory_cfg(corpus, os.path.join(workDir, "output"), args.workers, args.start_method,
+                                          None, runOptions, args.warm_up)
+        elapsed = time.perf_counter() - start
+
+    failed = sum(1 for s in statuses if not s["ok"])
+    results = {
+        "parameters": vars(args),
+        "files": len(statuses),
+        "failed": failed,
+        "statements": statements,
+        "seconds": elapsed,
+        "files_per_second": len(statuses) / elapsed,
+        "statements_per_second": statements / elapsed if statements is not None else None,
+        "peak_rss_kib": peakRssKiB(statuses),
+        "phases": totalPhases(s["phases"] for s in statuses),
+    }
+
+    print(f"files:        {len(statuses)} ({failed} failed)")
+    print(f"seconds:      {elapsed:.3f}")
+    print(f"files/s:      {results['files_per_second']:.2f}")
+    if statements is not None:
+        print(f"statements/s: {results['statements_per_second']:.1f} ({statements} statements)")
+    print(f"peak RSS:     parent {results['peak_rss_kib']['parent']} KiB, "
+          f"largest worker {results['peak_rss_kib']['workers']} KiB")
+    print("phases (summed over the workers):")
+    for name, phase in results["phases"].items():
+        print(f"  {name:<16} {phase['seconds']:>10.3f} s {phase['calls']:>8} calls")
+
+    if args.report:
+        with open(args.report, "w") as reportFile:
+            json.dump(results, reportFile, indent=4)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+import argparse
+import os
+import random
+
+
+class SyntheticJavaGenerator:
+    def __init__(self, seed=0, methods=4, statements=30, depth=2, switchArms=4, exprDepth=2):
+        """
+        Generates deterministic synthetic Java classes for benchmarking.
+
+        Only the constructs ASTListener supports are used: local variable declarations, assignments,
+        increments, println calls, if/else, for, while, do-while and switch statements with `break`,
+        always with a block body. methods is the number of methods per class, statements the number of
+        statements per method (nested ones included), depth the maximum nesting of compound statements,
+        switchArms the number of cases of a switch and exprDepth the depth of the generated expressions.
+        The same parameters and seed always give the same sources.
+        """
+        self.random = random.Random(seed)
+        self.methods = methods
+        self.statements = statements
+        self.depth = depth
+        self.switchArms = switchArms
+        self.exprDepth = exprDepth
+        self.statementCount = 0
+        self.loopCounter = 0
+
+    def genExpr(self, variables, depth=None):
+        depth = self.exprDepth if depth is None else depth
+        if depth <= 0 or self.random.random() < 0.25:
+            if self.random.random() < 0.6:
+                return self.random.choice(variables)
+            return str(self.random.randint(0, 99))
+
+        left = self.genExpr(variables, depth - 1)
+        right = self.genExpr(variables, depth - 1)
+        expr = f"{left} {self.random.choice(['+', '-', '*'])} {right}"
+        if depth < self.exprDepth and self.random.random() < 0.5:
+            expr = f"({expr})"
+        return expr
+
+    def genCond(self, variables):
+        return f"{self.random.choice(variables)} {self.random.choice(['<', '<=', '>', '>=', '==', '!='])} " \
+               f"{self.genExpr(variables, self.exprDepth - 1)}"
+
+    def genSimpleStmt(self, variables, indent):
+        pad = "    " * indent
+        kind = self.random.random()
+        if kind < 0.4:
+            return [f"{pad}{self.random.choice(variables)} = {self.genExpr(variables)};"]
+        if kind < 0.6:
+            return [f"{pad}{self.random.choice(variables)}++;"]
+        return [f"{pad}System.out.println({self.genExpr(variables)});"]
+
+    def genBlock(self, budget, variables, indent, depth):
+        # budget: number of statements of the block (the nested ones included), at least 1
+        lines = []
+        while budget > 0:
+            if depth < self.depth and budget >= 3 and self.random.random() < 0.3:
+                size = self.random.randint(2, max(2, min(budget - 1, budget // 2 + 1)))
+                lines += self.genCompoundStmt(size, variables, indent, depth + 1)
+            else:
+                size = 1
+                self.statementCount += 1
+                lines += self.genSimpleStmt(variables, indent)
+            budget -= size
+        return lines
+
+    def genCompoundStmt(self, budget, variables, indent, depth):
+        # the compound statement counts as one statement of the budget, the rest is its body
+        pad = "    " * indent
+        self.statementCount += 1
+        body = budget - 1
+        kind = self.random.choice(["if", "ifelse", "for", "while", "do", "switch"])
+
+        if kind == "if":
+            return [f"{pad}if ({self.genCond(variables)}) {{"] + \
+                self.genBlock(body, variables, indent + 1, depth) + [f"{pad}}}"]
+
+        if kind == "ifelse":
+            bodySize = max(1, body // 2)
+            elseSize = max(1, body - bodySize)
+            return [f"{pad}if ({self.genCond(variables)}) {{"] + \
+                self.genBlock(bodySize, variables, indent + 1, depth) + \
+                [f"{pad}}} else {{"] + \
+                self.genBlock(elseSize, variables, indent + 1, depth) + [f"{pad}}}"]
+
+        if kind == "for":
+            self.loopCounter += 1
+            i = f"i{self.loopCounter}"
+            return [f"{pad}for (int {i} = 0; {i} < {self.random.randint(1, 20)}; {i}++) {{"] + \
+                self.genBlock(body, variables + [i], indent + 1, depth) + [f"{pad}}}"]
+
+        if kind == "while":
+            return [f"{pad}while ({self.genCond(variables)}) {{"] + \
+                self.genBlock(body, variables, indent + 1, depth) + [f"{pad}}}"]
+
+        if kind == "do":
+            return [f"{pad}do {{"] + \
+                self.genBlock(body, variables, indent + 1, depth) + \
+                [f"{pad}}} while ({self.genCond(variables)});"]
+
+        # switch: every case gets at least one statement and a break
+        arms = max(1, min(self.switchArms, body))
+        lines = [f"{pad}switch ({self.random.choice(variables)}) {{"]
+        for arm in range(arms):
+            armSize = body // arms + (1 if arm < body % arms else 0)
+            label = "default:" if arm == arms - 1 and arms > 1 else f"case {arm}:"
+            lines.append(f"{pad}    {label}")
+            lines += self.genBlock(max(1, armSize), variables, indent + 2, self.depth)
+            self.statementCount += 1
+            lines.append(f"{pad}        break;")
+        lines.append(f"{pad}}}")
+        return lines
+
+    def genMethod(self, name):
+        variables = ["a", "b", "c", "d"]
+        lines = [f"    public static void {name}(String[] args) {{"]
+        for v in variables:
+            self.statementCount += 1
+            lines.append(f"        int {v} = {self.random.randint(0, 9)};")
+        lines += self.genBlock(max(1, self.statements - len(variables)), variables, 2, 0)
+        lines.append("    }")
+        return lines
+
+    def genClass(self, name):
+        lines = [f"public class {name} {{"]
+        for m in range(self.methods):
+            lines += self.genMethod(f"method{m}")
+            lines.append("")
+        lines.append("}")
+        return "\n".join(lines) + "\n"
+
+
+def writeCorpus(directory, files, seed=0, **options):
+    # writes `files` classes to directory, returns the total number of generated statements
+    os.makedirs(directory, exist_ok=True)
+    generator = SyntheticJavaGenerator(seed, **options)
+    for f in range(files):
+        name = f"Synthetic{f}"
+        with open(os.path.join(directory, f"{name}.java"), "w") as javaFile:
+            javaFile.write(generator.genClass(name))
+    return generator.statementCount
+
+
+def addCorpusArguments(argParser):
+    argParser.add_argument("--files", type=int, default=5, help="number of generated files (default: 5)")
+    argParser.add_argument("--methods", type=int, default=4, help="methods per file (default: 4)")
+    argParser.add_argument("--statements", type=int, default=30, help="statements per method (default: 30)")
+    argParser.add_argument("--depth", type=int, default=2, help="maximum nesting of for/while/if (default: 2)")
+    argParser.add_argument("--switch-arms", type=int, default=4, help="cases per switch (default: 4)")
+    argParser.add_argument("--expr-depth", type=int, default=2, help="depth of the expressions (default: 2)")
+    argParser.add_argument("--seed", type=int, default=0)
+
+
+def corpusOptions(args):
+    return {"methods": args.methods, "statements": args.statements, "depth": args.depth,
+            "switchArms": args.switch_arms, "exprDepth": args.expr_depth}
+
+
+def main(argv=None):
+    argParser = argparse.ArgumentParser(description="Write a deterministic synthetic Java corpus.")
+    argParser.add_argument("directory")
+    addCorpusArguments(argParser)
+    args = argParser.parse_args(argv)
+
+    statements = writeCorpus(args.directory, args.files, args.seed, **corpusOptions(args))
+    print(f"{args.files} files, {statements} statements written to {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,40 @@
 from enum import Enum
 
 
-class Pos:
-    def __init__(self, line=0, column=0):
-        """
-        Initialize a Position object with line and column values.
+class Pos(int):
+    """
+    An immutable source position (line and column), packed into a single int.
 
-        Args:
-            line (int): The line number.
-            column (int): The column number.
-        """
-        self.line = line
-        self.column = column
+    Args:
+        line (int): The line number.
+        column (int): The column number.
+    """
+    __slots__ = ()
+
+    def __new__(cls, line=0, column=0):
+        return super().__new__(cls, (line << 32) | column)
+
+    def __getnewargs__(self):
+        return self.line, self.column
+
+    @property
+    def line(self):
+        return int(self) >> 32
+
+    @property
+    def column(self):
+        return int(self) & 0xFFFFFFFF
+
+    def __repr__(self):
+        return f"Pos({self.line}, {self.column})"
 
     def __str__(self):
         return f"{self.line}:{self.column}"
 
 
 class Field:
+    __slots__ = ("pos", "name", "type_", "kind", "expr", "scope")
+
     def __init__(self, pos, name, type_, kind, expr):
         """
         Initialize a field (any type of variable or parameter).
@@ -50,6 +67,8 @@ class Field:
         }
 
 class UnaryExpr:
+    __slots__ = ("pos", "op", "expr")
+
     def __init__(self, pos, op, expr):
         """
         Initialize unary expressions like ++x, --x, +x, -x, ~x, !x, ...
@@ -95,6 +114,8 @@ class UnaryExpr:
         }
 
 class BinaryExpr:
+    __slots__ = ("pos", "lhs", "op", "rhs")
+
     def __init__(self, pos, lhs, op, rhs):
         """
         Initialize binary expressions like x + y, x - y, x * y, x / y, ...
@@ -105,7 +126,16 @@ class BinaryExpr:
         self.rhs = rhs
 
     def __str__(self):
-        return f"{self.lhs} {self.op} {self.rhs}"
+        # a left-nested chain (like a long string concatenation) is printed in a loop, not recursively
+        chain = []
+        expr = self
+        while type(expr) == BinaryExpr:
+            chain.append(expr)
+            expr = expr.lhs
+        text = f"{expr}"
+        for expr in reversed(chain):
+            text = f"{text} {expr.op} {expr.rhs}"
+        return text
 
     def to_dict(self):
         return {
@@ -115,6 +145,8 @@ class BinaryExpr:
         }
 
 class AssignExpr:
+    __slots__ = ("pos", "op", "lhs", "rhs")
+
     def __init__(self, pos, op, lhs, rhs):
         """
         Initialize assign expressions like x = y, x += y, x -= y, ...
@@ -138,6 +170,8 @@ class AssignExpr:
         }
 
 class CastExpr:
+    __slots__ = ("pos", "expr", "newType")
+
     def __init__(self, pos, expr, newType):
         """
         Initialize cast expressions like (int)x, (float)x, ...
@@ -157,6 +191,8 @@ class CastExpr:
         }
 
 class MallocExpr:
+    __slots__ = ("pos", "name", "args")
+
     def __init__(self, pos, name):
         """
         Initialize allocate expressions like new MyClass()
@@ -182,6 +218,8 @@ class MallocExpr:
         }
 
 class CallExpr:
+    __slots__ = ("pos", "package", "name", "args")
+
     def __init__(self, pos, package, name):
         """
         Initialize call expressions like mypackage.MyClass(myarg)
@@ -208,6 +246,8 @@ class CallExpr:
         }
 
 class ConditionalExpr:
+    __slots__ = ("pos", "cond", "trueExpr", "falseExpr")
+
     def __init__(self, pos, cond, trueExpr, falseExpr):
         """
         Initialize conditional expressions like x ? y : z
@@ -228,6 +268,8 @@ class ConditionalExpr:
         }
 
 class ExpressionStmt:
+    __slots__ = ("pos", "expr")
+
     def __init__(self, pos, expr):
         """
         Initialize expression statements like x = y, x += y, x -= y, ...
@@ -246,6 +288,8 @@ class ExpressionStmt:
         }
 
 class DeclStmt:
+    __slots__ = ("pos", "field")
+
     def __init__(self, pos, field):
         """
         Initialize declarations like int x, float y, ...
@@ -267,6 +311,8 @@ class DeclStmt:
         }
 
 class ReturnStmt:
+    __slots__ = ("pos", "expr")
+
     def __init__(self, pos, expr):
         """
         Initialize return statements like return x, return y, ...
@@ -290,6 +336,8 @@ class ReturnStmt:
 ###################################
 
 class BlockStmt:
+    __slots__ = ("pos", "body", "fields", "scope")
+
     def __init__(self, pos):
         """
         Initialize block statements like { x = y; }
@@ -299,7 +347,25 @@ class BlockStmt:
         self.fields = {}
         self.scope = ""
 
+    # the statements that contain other statements (the ones pushed on the stack of the AST listener)
+    # accept a finished child statement with acceptStmt, or a finished block with acceptBlock.
+    # switchCase is the current case of a switch statement.
+
+    def acceptStmt(self, stmt, switchCase=None):
+        self.body.append(stmt)
+
+    def acceptBlock(self, block, switchCase=None):
+        self.body.append(block)
+
+    def adoptBlock(self, block):
+        # block becomes this block: its statements (the same list), its scope and its fields
+        self.body = block.body
+        self.scope = block.scope
+        self.fields.update(block.fields)
+
 class BreakStmt:
+    __slots__ = ("pos", "targetLabel")
+
     def __init__(self, pos, targetLabel=None):
         """
         Initialize break statements
@@ -320,6 +386,8 @@ class BreakStmt:
         }
 
 class ContinueStmt:
+    __slots__ = ("pos", "targetLabel")
+
     def __init__(self, pos, targetLabel=None):
         """
         Initialize continue statements
@@ -341,6 +409,8 @@ class ContinueStmt:
 
 
 class LabeledStmt:
+    __slots__ = ("pos", "label", "stmt")
+
     def __init__(self, pos, label, stmt):
         """
         Initialize labeled statements
@@ -357,6 +427,8 @@ class LabeledStmt:
     #     }
 
 class BasicForStmt:
+    __slots__ = ("pos", "initStmtList", "condExpr", "updateStmtList", "bodyBlock")
+
     def __init__(self, pos, condExpr):
         """
         Initialize basic for statements
@@ -367,7 +439,18 @@ class BasicForStmt:
         self.updateStmtList = []
         self.bodyBlock = None
 
+    def acceptStmt(self, stmt, switchCase=None):
+        self.bodyBlock.body.append(stmt)
+
+    def acceptBlock(self, block, switchCase=None):
+        # the body block may already hold the assignment of the variable of an enhanced for
+        self.bodyBlock.body.extend(block.body)
+        self.bodyBlock.scope = block.scope
+        self.bodyBlock.fields.update(block.fields)
+
 class IfStmt:
+    __slots__ = ("pos", "condExpr", "bodyBlock", "elseBlock", "currentBlock", "hasElif")
+
     def __init__(self, pos, condExpr):
         """
         Initialize if statements
@@ -379,7 +462,19 @@ class IfStmt:
         self.currentBlock = ""
         self.hasElif = False
 
+    def branch(self):
+        # the block the statements go to, the else block after the first block of the statement
+        return self.bodyBlock if self.currentBlock == "bodyBlock" else self.elseBlock
+
+    def acceptStmt(self, stmt, switchCase=None):
+        self.branch().body.append(stmt)
+
+    def acceptBlock(self, block, switchCase=None):
+        self.branch().adoptBlock(block)
+
 class WhileStmt:
+    __slots__ = ("pos", "condExpr", "bodyBlock")
+
     def __init__(self, pos, condExpr):
         """
         Initialize while statements
@@ -388,7 +483,15 @@ class WhileStmt:
         self.condExpr = condExpr
         self.bodyBlock = None
 
+    def acceptStmt(self, stmt, switchCase=None):
+        self.bodyBlock.body.append(stmt)
+
+    def acceptBlock(self, block, switchCase=None):
+        self.bodyBlock.adoptBlock(block)
+
 class DoWhileStmt:
+    __slots__ = ("pos", "condExpr", "bodyBlock")
+
     def __init__(self, pos, condExpr):
         """
         Initialize do-while statements
@@ -397,7 +500,15 @@ class DoWhileStmt:
         self.condExpr = condExpr
         self.bodyBlock = None
 
+    def acceptStmt(self, stmt, switchCase=None):
+        self.bodyBlock.body.append(stmt)
+
+    def acceptBlock(self, block, switchCase=None):
+        self.bodyBlock.adoptBlock(block)
+
 class SwitchStmt:
+    __slots__ = ("pos", "expr", "caseBlocks")
+
     def __init__(self, pos, expr):
         """
         Initialize switch statements
@@ -406,17 +517,29 @@ class SwitchStmt:
         self.expr = expr
         self.caseBlocks = {}
 
+    def acceptStmt(self, stmt, switchCase=None):
+        self.caseBlocks[switchCase].body.append(stmt)
+
+    def acceptBlock(self, block, switchCase=None):
+        self.caseBlocks[switchCase].adoptBlock(block)
+
 
 class Method:
+    __slots__ = ("pos", "name", "bodyBlock", "retType", "scope", "scopes")
+
     def __init__(self, pos, name, retType):
         self.pos = pos
         self.name = name
         self.bodyBlock = None
         self.retType = retType
         self.scope = ""
+        # the scopes of the method: its body by name, its other blocks by scope id (released with the body)
+        self.scopes = {}
 
 
 class Class:
+    __slots__ = ("pos", "name", "modifiers", "fields")
+
     def __init__(self, pos, name):
         self.pos = pos
         self.name = name
@@ -425,7 +548,11 @@ class Class:
 
 
 class AST:
+    __slots__ = ("package", "decls", "scopes")
+
     def __init__(self):
         self.package = ""
         self.decls = []
+        # the scopes outside of the methods: classes by name, other blocks (initializers, ...) by scope id
+        # (an int, see ASTListener.addScope). the scopes of a method are in Method.scopes.
         self.scopes = {}
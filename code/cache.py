@@ -0,0 +1,166 @@
+import hashlib
+import os
+import pickle
+import tempfile
+from pathlib import Path
+
+
+toolVersionHash = None
+
+
+def toolVersion():
+    # hash of the sources that decide what is generated for a java file (the code package and the
+    # generated lexer/parser), computed once per process: any change to them invalidates the cache.
+    global toolVersionHash
+    if toolVersionHash is None:
+        root = Path(__file__).resolve().parent.parent
+        sources = sorted((root / "code").glob("*.py")) + [root / "gen" / "Java20Lexer.py", root / "gen" / "Java20Parser.py"]
+        h = hashlib.sha256()
+        for source in sources:
+            h.update(source.name.encode("utf8"))
+            h.update(source.read_bytes())
+        toolVersionHash = h.hexdigest()
+    return toolVersionHash
+
+
+class ResultCache:
+    def __init__(self, directory, maxBytes=None):
+        """
+        A persistent cache of the files generated for a java file, keyed by a hash of the file contents,
+        the tool/grammar version (see toolVersion()) and the output options.
+
+        Each entry is one file of the cache directory, written atomically, so the workers of a pool can
+        share the cache. Hit/miss counters are kept per process, evict() removes the least recently used
+        entries until the cache fits in maxBytes.
+        """
+        self.directory = Path(directory)
+        self.maxBytes = maxBytes
+        self.hits = 0
+        self.misses = 0
+        self.bytesRead = 0
+        self.bytesWritten = 0
+
+    def key(self, data, options=""):
+        h = hashlib.sha256()
+        h.update(toolVersion().encode("utf8"))
+        h.update(str(options).encode("utf8"))
+        h.update(data)
+        return h.hexdigest()
+
+    def entryPath(self, key):
+        return self.directory / key[:2] / f"{key}.entry"
+
+    def get(self, key):
+        # {file name: contents} of the entry, or None
+        path = self.entryPath(key)
+        try:
+            raw = path.read_bytes()
+            files = pickle.loads(raw)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            self.misses += 1
+            return None
+
+        # the modification time of an entry is its last use, for the eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        self.bytesRead += len(raw)
+        return files
+
+    def put(self, key, files):
+        path = self.entryPath(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        raw = pickle.dumps(files, protocol=pickle.HIGHEST_PROTOCOL)
+        fd, tmpPath = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmpFile:
+                tmpFile.write(raw)
+            os.replace(tmpPath, path)
+        except OSError:
+            if os.path.exists(tmpPath):
+                os.remove(tmpPath)
+            raise
+        self.bytesWritten += len(raw)
+
+    def restore(self, key, outputDir):
+        # writes the files of the entry to outputDir, returns False on a miss
+        files = self.get(key)
+        if files is None:
+            return False
+        for name, contents in files.items():
+            with open(os.path.join(outputDir, name), "wb") as f:
+                f.write(contents)
+        return True
+
+    def store(self, key, outputDir, names):
+        files = {}
+        for name in names:
+            with open(os.path.join(outputDir, name), "rb") as f:
+                files[name] = f.read()
+        self.put(key, files)
+
+    def entries(self):
+        # (path, size, last use) of every entry
+        result = []
+        if not self.directory.is_dir():
+            return result
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".entry"):
+                    stat = entry.stat()
+                    result.append((entry.path, stat.st_size, stat.st_mtime))
+        return result
+
+    def evict(self):
+        # removes the least recently used entries until the cache fits in maxBytes,
+        # returns the number of removed entries
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        if self.maxBytes is None or total <= self.maxBytes:
+            return removed
+
+        for path, size, _ in sorted(entries, key=lambda e: e[2]):
+            if total <= self.maxBytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+    def counts(self):
+        return {"hits": self.hits, "misses": self.misses, "bytes_read": self.bytesRead, "bytes_written": self.bytesWritten}
+
+    def addCounts(self, counts):
+        # adds the counts of another process (see counts())
+        if not counts:
+            return
+        self.hits += counts["hits"]
+        self.misses += counts["misses"]
+        self.bytesRead += counts["bytes_read"]
+        self.bytesWritten += counts["bytes_written"]
+
+    def stats(self):
+        entries = self.entries()
+        stats = self.counts()
+        stats["entries"] = len(entries)
+        stats["bytes"] = sum(size for _, size, _ in entries)
+        return stats
+
+
+# one result cache per process, see getResultCache()
+resultCache = None
+
+
+def getResultCache(directory, maxBytes=None):
+    global resultCache
+    if resultCache is None or resultCache.directory != Path(directory):
+        resultCache = ResultCache(directory, maxBytes)
+    return resultCache
@@ -1,13 +1,18 @@
+import bisect
 import html
 import json
 import os
+import queue
 import random
 import re
-import time
+import threading
+from enum import Enum
 
-import networkx as nx
-import graphviz as gv
 from code.ast import *
+from code.graph import CFGraph
+from code.incremental import MethodManifest, methodFingerprint
+from code.render import getRenderQueue
+from code.timing import getPhaseTimer
 
 
 class BasicBlock:
@@ -88,11 +93,97 @@ class BasicBlock:
         return res_stmts
 
 
+class OutputMode(Enum):
+    # what Gen() writes for every method
+    NONE = "none"  # nothing, only build the CFGs (benchmarking)
+    JSON = "json"  # the json dump only
+    DOT = "dot"  # the graphviz DOT text only
+    PDF = "pdf"  # the json dump and the graph rendered by graphviz as pdf
+    SVG = "svg"  # the json dump and the graph rendered by graphviz as svg
+
+    def extensions(self):
+        # the output files written for every method
+        return {
+            OutputMode.NONE: [],
+            OutputMode.JSON: [".json"],
+            OutputMode.DOT: [".dot"],
+            OutputMode.PDF: [".json", ".pdf"],
+            OutputMode.SVG: [".json", ".svg"],
+        }[self]
+
+
+class MethodSink:
+    def __init__(self, cfg, threaded=False, maxPending=16):
+        """
+        Receives the methods of a file one by one, as soon as the tree walker has built them,
+        and generates their CFGs with cfg (a SourceLevelCFG).
+
+        The body of a method (and its scopes) is released once its CFG is written. With threaded, the CFGs are generated
+        by a background thread fed through a bounded queue (at most maxPending methods wait), so the
+        CFG stage runs alongside the tree walk. close() waits for the last method and raises the first
+        error of the background thread.
+        """
+        self.cfg = cfg
+        self.cfg.begin()
+        self.error = None
+        self.queue = None
+        self.thread = None
+
+        if threaded:
+            self.queue = queue.Queue(maxsize=maxPending)
+            self.thread = threading.Thread(target=self.drain, daemon=True)
+            self.thread.start()
+
+    def submit(self, i, method):
+        if self.queue is not None:
+            self.queue.put((i, method))
+        else:
+            self.emit(i, method)
+
+    def emit(self, i, method):
+        self.cfg.genMethod(i, method)
+        method.bodyBlock = None
+        method.scopes = None
+
+    def drain(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            # after an error the remaining methods are only consumed, so submit() never blocks forever
+            if self.error is None:
+                try:
+                    self.emit(*item)
+                except Exception as e:
+                    self.error = e
+
+    def stop(self):
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def close(self):
+        self.stop()
+        if self.error is not None:
+            raise self.error
+        self.cfg.finish()
+
+    def abort(self):
+        # the walk failed: stop the background thread, the methods still queued are dropped
+        self.error = self.error or Exception("aborted")
+        self.stop()
+
+
 class SourceLevelCFG:
-    def __init__(self, ast,output_dir):
+    def __init__(self, ast,output_dir, outputMode=OutputMode.PDF, incremental=False):
         self.ast = ast
         self.output_dir = output_dir
-        self.CFG = nx.DiGraph()
+        self.outputMode = outputMode
+        # incremental: only the methods whose fingerprint changed since the last run are generated again
+        self.incremental = incremental and outputMode != OutputMode.NONE
+        self.manifest = None
+        self.CFG = CFGraph()
         self.basicBlocks = {}
         self.bIndex = 0
         self.isReturn = False
@@ -107,7 +198,7 @@ class SourceLevelCFG:
         self.CFG.add_edge(0, self.bIndex)
 
     def reset(self):
-        self.CFG = nx.DiGraph()
+        self.CFG = CFGraph()
         self.basicBlocks = {}
         self.bIndex = 0
         self.isReturn = False
@@ -122,82 +213,119 @@ class SourceLevelCFG:
         self.CFG.add_edge(0, self.bIndex)
 
     def Gen(self):
+        self.begin()
         for i, d in enumerate(self.ast.decls):
             if type(d) == Class:
                 continue
             elif type(d) == Method:
-                if len(d.bodyBlock.body) == 0:
-                    continue
+                self.genMethod(i, d)
+        self.finish()
+
+    def begin(self):
+        self.manifest = MethodManifest(self.output_dir, self.outputMode.extensions()) if self.incremental else None
+
+    def finish(self):
+        if self.manifest is not None:
+            self.manifest.save()
+
+    def genMethod(self, i, d):
+        # generates and writes the CFG of method d, the i-th declaration of the AST
+        timer = getPhaseTimer()
+        if len(d.bodyBlock.body) == 0:
+            return
+
+        if self.manifest is not None:
+            outputName = os.path.basename(self.getOutputFilename(i, d, ""))
+            fingerprint = methodFingerprint(self.ast, d, outputName)
+            self.manifest.record(outputName, fingerprint)
+            # the outputs of the last run are still valid
+            if self.manifest.isUpToDate(outputName, fingerprint):
+                return
+
+        with timer.phase("cfg"):
+            self.reset()
+            self.genMethodCFG(d)
+
+        with timer.phase("prepareFinalCFG"):
+            self.prepareFinalCFG()
+
+        # data only modes skip graphviz and the html labels entirely
+        if self.outputMode in (OutputMode.JSON, OutputMode.PDF, OutputMode.SVG):
+            with timer.phase("dumpJson"):
+                self.dumpJson(i,d,"")
+        if self.outputMode in (OutputMode.DOT, OutputMode.PDF, OutputMode.SVG):
+            with timer.phase("drawCFG"):
+                self.drawCFG(i,d,"")
 
-                self.reset()
+        # _, _ = self.constructFlattenCFG(self.CFG)
 
-                lastBodyIndex = self.bIndex
-                lastGraphOpenNodes = [1]
+        # self.prepareFlattenCFG()
 
-                for s in d.bodyBlock.body:
-                    res = self.genGenericStmt(s)
+        # self.dumpJson(i, d, "flatten")
+        # self.drawCFG(i,d,"flatten")
 
-                    if self.isReturn:
-                        self.isReturn = False
-                        self.basicBlocks[self.bIndex].attr["return"] = True
+    def genMethodCFG(self, method):
+        # builds the CFG of the method body into self.CFG.
+        # the graph is extended in place, statement by statement: the nodes left open by the
+        # last compound statement are tracked in lastGraphOpenNodes and are connected once,
+        # when the next block gets its first statement, so the cost of a statement doesn't
+        # depend on the size of the graph built so far.
+        lastBodyIndex = self.bIndex
+        lastGraphOpenNodes = [1]
 
-                    if type(res) == nx.DiGraph:
-                        for i in lastGraphOpenNodes:
-                            if self.basicBlocks[i].type == "conditional":
-                                if self.CFG.out_degree(i) == 1:
-                                    self.CFG.add_edge(i, min(res.nodes), label="false")
-                            else:
-                                if self.CFG.out_degree(i) == 0:
-                                    self.CFG.add_edge(i, min(res.nodes))
+        for s in method.bodyBlock.body:
+            res = self.genGenericStmt(s)
 
-                        lastGraphOpenNodes = []
+            if self.isReturn:
+                self.isReturn = False
+                self.basicBlocks[self.bIndex].attr["return"] = True
 
-                        for od in res.out_degree():
-                            if od[1] == 0:
-                                lastGraphOpenNodes.append(od[0])
-                            if self.basicBlocks[od[0]].type == "conditional":
-                                lastGraphOpenNodes.append(od[0])
+            if type(res) == CFGraph:
+                resEntry = min(res.nodes)
 
-                        self.CFG = nx.compose(self.CFG, res)
+                for j in lastGraphOpenNodes:
+                    if self.basicBlocks[j].type == "conditional":
+                        if self.CFG.out_degree(j) == 1:
+                            self.CFG.add_edge(j, resEntry, label="false")
+                    else:
+                        if self.CFG.out_degree(j) == 0:
+                            self.CFG.add_edge(j, resEntry)
 
-                        if not self.CFG.has_edge(lastBodyIndex, min(res.nodes)):
-                            self.CFG.add_edge(lastBodyIndex, min(res.nodes))
+                lastGraphOpenNodes = []
 
-                        if lastBodyIndex != self.bIndex and d.bodyBlock.body[-1] != s:
-                            self.bIndex += 1
-                            self.basicBlocks[self.bIndex] = BasicBlock()
-                            lastBodyIndex = self.bIndex
-                            self.CFG.add_node(lastBodyIndex)
+                for od in res.out_degree():
+                    if od[1] == 0:
+                        lastGraphOpenNodes.append(od[0])
+                    if self.basicBlocks[od[0]].type == "conditional":
+                        lastGraphOpenNodes.append(od[0])
 
-                    else:
-                        self.basicBlocks[lastBodyIndex].stmts.append(res)
-                        gCopy = self.CFG.copy()
-                        for i in gCopy.in_degree():
-                            if i[0] == lastBodyIndex:
-                                if i[1] == 0:
-                                    for j in lastGraphOpenNodes:
-                                        if self.basicBlocks[j].type == "conditional":
-                                            if self.CFG.out_degree(j) == 1:
-                                                self.CFG.add_edge(j, lastBodyIndex, label="false")
-                                        else:
-                                            if self.CFG.out_degree(j) == 0:
-                                                self.CFG.add_edge(j, lastBodyIndex)
-
-                self.prepareFinalCFG()
+                self.CFG.update(res)
 
-                self.dumpJson(i,d,"")
-                self.drawCFG(i,d,"")
+                if not self.CFG.has_edge(lastBodyIndex, resEntry):
+                    self.CFG.add_edge(lastBodyIndex, resEntry)
 
-                # _, _ = self.constructFlattenCFG(self.CFG)
+                if lastBodyIndex != self.bIndex and method.bodyBlock.body[-1] != s:
+                    self.bIndex += 1
+                    self.basicBlocks[self.bIndex] = BasicBlock()
+                    lastBodyIndex = self.bIndex
+                    self.CFG.add_node(lastBodyIndex)
 
-                # self.prepareFlattenCFG()
+            else:
+                self.basicBlocks[lastBodyIndex].stmts.append(res)
 
-                # self.dumpJson(i, d, "flatten")
-                # self.drawCFG(i,d,"flatten")
+                # the open nodes are connected only to a block that has no input edge yet
+                if self.CFG.in_degree(lastBodyIndex) == 0:
+                    for j in lastGraphOpenNodes:
+                        if self.basicBlocks[j].type == "conditional":
+                            if self.CFG.out_degree(j) == 1:
+                                self.CFG.add_edge(j, lastBodyIndex, label="false")
+                        else:
+                            if self.CFG.out_degree(j) == 0:
+                                self.CFG.add_edge(j, lastBodyIndex)
 
     def genBlockStmt(self, stmt):
 
-        g = nx.DiGraph()
+        g = CFGraph()
 
         self.bIndex += 1
         self.basicBlocks[self.bIndex] = BasicBlock()
@@ -218,7 +346,7 @@ class SourceLevelCFG:
                 self.isReturn = False
                 self.basicBlocks[self.bIndex].attr["return"] = True
 
-            if type(res) == nx.DiGraph:
+            if type(res) == CFGraph:
                 g.add_edge(lastBodyIndex, min(res.nodes))
 
                 for i in lastGraphOpenNodes:
@@ -230,7 +358,7 @@ class SourceLevelCFG:
                     if od[1] == 0:
                         lastGraphOpenNodes.append(od[0])
 
-                g = nx.compose(g, res)
+                g.update(res)
 
                 if lastBodyIndex != self.bIndex and stmt.body[-1] != s:
                     self.bIndex += 1
@@ -257,7 +385,7 @@ class SourceLevelCFG:
 
     def genBasicForStmt(self, stmt):
 
-        g = nx.DiGraph()
+        g = CFGraph()
 
         if len(stmt.initStmtList) != 0:
             self.bIndex += 1
@@ -283,7 +411,7 @@ class SourceLevelCFG:
 
         bodyGraph = self.genBlockStmt(stmt.bodyBlock)
 
-        g = nx.compose(g, bodyGraph)
+        g.update(bodyGraph)
 
         g.add_edge(condIndex, min(bodyGraph.nodes), label="true")
 
@@ -297,24 +425,21 @@ class SourceLevelCFG:
 
             g.add_edge(updateIndex, condIndex)
 
-            gCopy = bodyGraph.copy()
-            for od in gCopy.out_degree():
+            for od in bodyGraph.out_degree():
                 if od[1] == 0 and od[0] != updateIndex:
                     g.add_edge(od[0], updateIndex)
                 elif od[1] == 1 and self.basicBlocks[od[0]].type == "conditional":
                     g.add_edge(od[0], updateIndex, label="false")
 
         else:
-            gCopy = g.copy()
-            for od in gCopy.out_degree():
-                if od[1] == 0:
-                    g.add_edge(od[0], condIndex)
+            for node in [od[0] for od in g.out_degree() if od[1] == 0]:
+                g.add_edge(node, condIndex)
 
         return g
 
     def genIfStmt(self, stmt):
 
-        g = nx.DiGraph()
+        g = CFGraph()
 
         hasElif = stmt.hasElif
 
@@ -352,7 +477,7 @@ class SourceLevelCFG:
                 if not hasElif:
                     res = self.genGenericStmt(s)
 
-                    if type(res) == nx.DiGraph:
+                    if type(res) == CFGraph:
                         g.add_edge(lastBodyIndex, min(res.nodes))
 
                         for i in lastGraphOpenNodes:
@@ -363,7 +488,7 @@ class SourceLevelCFG:
                             if od[1] == 0:
                                 lastGraphOpenNodes.append(od[0])
 
-                        g = nx.compose(g, res)
+                        g.update(res)
                         if lastBodyIndex != self.bIndex:
                             self.bIndex += 1
                             self.basicBlocks[self.bIndex] = BasicBlock()
@@ -381,11 +506,11 @@ class SourceLevelCFG:
                     res = self.genIfStmt(s)
                     g.add_edge(lastCondIndex, min(res.nodes), label="false")
                     lastCondIndex = max(res.nodes)
-                    g = nx.compose(g, res)
+                    g.update(res)
 
             else:
                 res = self.genGenericStmt(s)
-                if type(res) == nx.DiGraph:
+                if type(res) == CFGraph:
                     g.add_edge(lastBodyIndex, min(res.nodes))
 
                     for i in lastGraphOpenNodes:
@@ -396,7 +521,7 @@ class SourceLevelCFG:
                         if od[1] == 0:
                             lastGraphOpenNodes.append(od[0])
 
-                    g = nx.compose(g, res)
+                    g.update(res)
                     if lastBodyIndex != self.bIndex:
                         self.bIndex += 1
                         self.basicBlocks[self.bIndex] = BasicBlock()
@@ -432,10 +557,10 @@ class SourceLevelCFG:
                     self.isReturn = False
                     self.basicBlocks[self.bIndex].attr["return"] = True
 
-                if type(res) == nx.DiGraph:
+                if type(res) == CFGraph:
                     g.add_edge(lastBodyIndex, min(res.nodes))
 
-                    g = nx.compose(g, res)
+                    g.update(res)
                     if lastBodyIndex != self.bIndex:
                         self.bIndex += 1
                         self.basicBlocks[self.bIndex] = BasicBlock()
@@ -456,7 +581,7 @@ class SourceLevelCFG:
         return g
 
     def genWhileStmt(self, stmt):
-        g = nx.DiGraph()
+        g = CFGraph()
 
         self.bIndex += 1
         self.basicBlocks[self.bIndex] = BasicBlock()
@@ -470,7 +595,7 @@ class SourceLevelCFG:
 
         g.add_edge(condIndex, min(bodyGraph.nodes), label="true")
 
-        g = nx.compose(g, bodyGraph)
+        g.update(bodyGraph)
 
         for od in bodyGraph.out_degree():
             if od[1] == 0:
@@ -482,10 +607,10 @@ class SourceLevelCFG:
         return g
 
     def genDoWhileStmt(self, stmt):
-        g = nx.DiGraph()
+        g = CFGraph()
 
         bodyGraph = self.genBlockStmt(stmt.bodyBlock)
-        g = nx.compose(g, bodyGraph)
+        g.update(bodyGraph)
 
         self.bIndex += 1
         self.basicBlocks[self.bIndex] = BasicBlock()
@@ -506,7 +631,7 @@ class SourceLevelCFG:
         return g
 
     def genSwitchStmt(self, stmt):
-        g = nx.DiGraph()
+        g = CFGraph()
 
         self.bIndex += 1
         switchIndex = self.bIndex
@@ -527,7 +652,7 @@ class SourceLevelCFG:
         for k, v in stmt.caseBlocks.items():
             bodyGraph = self.genBlockStmt(v)
 
-            g = nx.compose(g, bodyGraph)
+            g.update(bodyGraph)
 
             g.add_edge(switchIndex, min(bodyGraph.nodes), label=f"{k}")
 
@@ -612,6 +737,30 @@ class SourceLevelCFG:
                     g.add_edge(newEdgeStart, newEdgeEnd, label=label)
         return g
 
+    def removeUnreachableBlocks(self, endNodeIndex):
+        # garbage blocks: everything that can't be reached from the start block,
+        # found with one traversal and removed in bulk.
+        reachable = set(self.CFG.dfsNodes(0))
+        for node in self.CFG.nodes:
+            if node not in reachable and node != 0 and node != endNodeIndex:
+                self.CFG.remove_node(node)
+                del self.basicBlocks[node]
+
+    def rewireEndEdges(self, endNodeIndex):
+        # a block that still has no input edge continues the closest block before it that goes to
+        # the end block: that edge to the end block is moved to the block.
+        # the blocks going to the end block are kept sorted, so the closest one is found by bisection.
+        endSources = sorted(source for source, _ in self.CFG.in_edges(endNodeIndex))
+        for i in list(self.CFG.in_degree()):
+            if i[0] == 0 or i[0] == endNodeIndex:
+                continue
+            if i[1] == 0:
+                k = bisect.bisect_left(endSources, i[0]) - 1
+                if k >= 0:
+                    counter = endSources.pop(k)
+                    self.CFG.remove_edge(counter, endNodeIndex)
+                    self.CFG.add_edge(counter, i[0])
+
     def prepareFinalCFG(self):
         self.bIndex += 1
         endNodeIndex = self.bIndex
@@ -632,9 +781,8 @@ class SourceLevelCFG:
                 returnNodes.append(node)
 
         for node in returnNodes:
-            gCopy = self.CFG.copy()
             try:
-                for _, target in gCopy.out_edges(node):
+                for _, target in list(self.CFG.out_edges(node)):
                     self.CFG.remove_edge(node, target)
                     self.CFG.remove_node(target)
                     del self.basicBlocks[target]
@@ -642,22 +790,9 @@ class SourceLevelCFG:
             except:
                 pass
 
-        garbageNodes = []
-        gCopy = self.CFG.copy()
-        for ind in gCopy.in_degree():
-            if not nx.has_path(gCopy, 0, ind[0]) and ind[0] != 0 and ind[0] != endNodeIndex:
-                for _, target in gCopy.out_edges(ind[0]):
-                    self.CFG.remove_edge(ind[0], target)
-                T = nx.dfs_tree(self.CFG, ind[0])
-                for node in T.nodes:
-                    garbageNodes.append(node)
-
-        for node in garbageNodes:
-            self.CFG.remove_node(node)
-            del self.basicBlocks[node]
-
-        gCopy = self.CFG.copy()
-        for od in gCopy.out_degree():
+        self.removeUnreachableBlocks(endNodeIndex)
+
+        for od in list(self.CFG.out_degree()):
             if self.basicBlocks[od[0]].type == "conditional":
                 if od[1] == 1:
                     self.CFG.add_edge(od[0], endNodeIndex, label="false")
@@ -667,8 +802,7 @@ class SourceLevelCFG:
                     self.CFG.add_edge(od[0], endNodeIndex)
 
         # remove blocks with no input edge
-        gCopy = self.CFG.copy()
-        for i in gCopy.in_degree():
+        for i in list(self.CFG.in_degree()):
             if i[0] == 0 or i[0] == endNodeIndex:
                 continue
             if i[1] == 0:
@@ -676,28 +810,36 @@ class SourceLevelCFG:
                     self.CFG.remove_node(i[0])
                     del self.basicBlocks[i[0]]
 
-        gCopy = self.CFG.copy()
-        for i in gCopy.in_degree():
-            if i[0] == 0 or i[0] == endNodeIndex:
-                continue
-            if i[1] == 0:
-                counter = i[0]
-                while counter != 0:
-                    if self.CFG.has_edge(counter - 1, endNodeIndex):
-                        self.CFG.remove_edge(counter - 1, endNodeIndex)
-                        counter -= 1
-                        self.CFG.add_edge(counter, i[0])
-                        break
-                    else:
-                        counter -= 1
+        self.rewireEndEdges(endNodeIndex)
 
         try:
             self.CFG = self.removeEmptyBlocks(self.CFG)
         except:
             pass
 
+    def getOutputFilename(self, i, method, ext):
+        # output file name (without extension) shared by the json and the rendered graph of a method
+        method_name = method.name
+
+        method_name = method_name.replace("<","_",-1)
+        method_name = method_name.replace(">", "_", -1)
+        method_name = method_name.replace(":", "_", -1)
+        method_name = method_name.replace("|", "_", -1)
+        method_name = method_name.replace("(", "_", -1)
+        method_name = method_name.replace(")", "_", -1)
+
+        filename = f"{self.output_dir}/{method_name}_{ext}"
+
+        if "_" in method_name:
+            filename = f"{self.output_dir}/{method_name.split('_')[0]}_[{i}]_{ext}"
+
+        return filename
+
     def drawCFG(self, i, method,ext):
-        gd = gv.Digraph(format="pdf", node_attr={"shape": "none"}, strict=True, graph_attr={"rankdir": "TD"})
+        # imported here: graphviz is slow to import and only needed for the dot, pdf and svg outputs
+        import graphviz as gv
+
+        gd = gv.Digraph(node_attr={"shape": "none"}, strict=True, graph_attr={"rankdir": "TD"})
 
         gd.node(f'package: {self.ast.package}\nclass: {method.scope}\nmethod: {method.name}', style="filled",
                 fillcolor="#ffff00", shape="tab", fontsize="9")
@@ -734,26 +876,14 @@ class SourceLevelCFG:
             else:
                 gd.edge(str(edgeStartNode), str(edgeEndNode), tailport="s")
 
-        method_name = method.name
-
-        method_name = method_name.replace("<","_",-1)
-        method_name = method_name.replace(">", "_", -1)
-        method_name = method_name.replace(":", "_", -1)
-        method_name = method_name.replace("|", "_", -1)
-        method_name = method_name.replace("(", "_", -1)
-        method_name = method_name.replace(")", "_", -1)
-
-        filename = f"{self.output_dir}/{method_name}_{ext}"
-
-        if "_" in method_name:
-            if type(i) == tuple:
-                filename = f"{self.output_dir}/{method_name.split("_")[0]}_[{i[0]}]_{ext}"
-            elif type(i) == int:
-                filename = f"{self.output_dir}/{method_name.split("_")[0]}_[{i}]_{ext}"
+        if self.outputMode == OutputMode.DOT:
+            with open(self.getOutputFilename(i, method, ext) + ".dot", 'w') as dot_file:
+                dot_file.write(gd.source)
+            return
 
-        gd.render(filename, view=False)
-        time.sleep(1)
-        os.remove(filename)
+        # rendering is handed to the process render queue, a pool of `dot` subprocesses,
+        # so CFG generation of the next methods doesn't wait for graphviz.
+        getRenderQueue().submit(gd.source, self.getOutputFilename(i, method, ext), self.outputMode.value)
 
     def dumpJson(self,i,method,ext):
         cfgDict = {
@@ -830,22 +960,7 @@ class SourceLevelCFG:
                     }
                 )
 
-        method_name = method.name
-
-        method_name = method_name.replace("<","_",-1)
-        method_name = method_name.replace(">", "_", -1)
-        method_name = method_name.replace(":", "_", -1)
-        method_name = method_name.replace("|", "_", -1)
-        method_name = method_name.replace("(", "_", -1)
-        method_name = method_name.replace(")", "_", -1)
-
-        filename = f"{self.output_dir}/{method_name}_{ext}.json"
-
-        if "_" in method_name:
-            if type(i) == tuple:
-                filename = f"{self.output_dir}/{method_name.split("_")[0]}_[{i[0]}]_{ext}.json"
-            elif type(i) == int:
-                filename = f"{self.output_dir}/{method_name.split("_")[0]}_[{i}]_{ext}.json"
+        filename = self.getOutputFilename(i, method, ext) + ".json"
 
         with open(filename, 'w') as json_file:
             json.dump(cfgDict, json_file, indent=4)
@@ -858,22 +973,9 @@ class SourceLevelCFG:
         self.basicBlocks[endNodeIndex] = BasicBlock()
         self.basicBlocks[endNodeIndex].type = "end"
 
-        garbageNodes = []
-        gCopy = self.CFG.copy()
-        for ind in gCopy.in_degree():
-            if not nx.has_path(gCopy, 0, ind[0]) and ind[0] != 0 and ind[0] != endNodeIndex:
-                for _, target in gCopy.out_edges(ind[0]):
-                    self.CFG.remove_edge(ind[0], target)
-                T = nx.dfs_tree(self.CFG, ind[0])
-                for node in T.nodes:
-                    garbageNodes.append(node)
-
-        for node in garbageNodes:
-            self.CFG.remove_node(node)
-            del self.basicBlocks[node]
-
-        gCopy = self.CFG.copy()
-        for od in gCopy.out_degree():
+        self.removeUnreachableBlocks(endNodeIndex)
+
+        for od in list(self.CFG.out_degree()):
             if self.basicBlocks[od[0]].type == "conditional":
                 if od[1] == 1:
                     self.CFG.add_edge(od[0], endNodeIndex, label="false")
@@ -883,8 +985,7 @@ class SourceLevelCFG:
                     self.CFG.add_edge(od[0], endNodeIndex)
 
         # remove blocks with no input edge
-        gCopy = self.CFG.copy()
-        for i in gCopy.in_degree():
+        for i in list(self.CFG.in_degree()):
             if i[0] == 0 or i[0] == endNodeIndex:
                 continue
             if i[1] == 0:
@@ -892,19 +993,6 @@ class SourceLevelCFG:
                     self.CFG.remove_node(i[0])
                     del self.basicBlocks[i[0]]
 
-        gCopy = self.CFG.copy()
-        for i in gCopy.in_degree():
-            if i[0] == 0 or i[0] == endNodeIndex:
-                continue
-            if i[1] == 0:
-                counter = i[0]
-                while counter != 0:
-                    if self.CFG.has_edge(counter - 1, endNodeIndex):
-                        self.CFG.remove_edge(counter - 1, endNodeIndex)
-                        counter -= 1
-                        self.CFG.add_edge(counter, i[0])
-                        break
-                    else:
-                        counter -= 1
+        self.rewireEndEdges(endNodeIndex)
 
         self.CFG = self.removeEmptyBlocks(self.CFG)
\ No newline at end of file
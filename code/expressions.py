@@ -1,12 +1,49 @@
 import re
 
-from antlr4.tree.Tree import TerminalNodeImpl
+from antlr4.tree.Tree import TerminalNode, TerminalNodeImpl
 
 from code.ast import *
 from gen.Java20Parser import Java20Parser
 
 
+class Pending:
+    __slots__ = ("children", "combine", "results")
+
+    def __init__(self, children, combine):
+        """
+        An expression waiting for the expressions of its children contexts:
+        once they are all built, combine(*results) returns the expression.
+        """
+        self.children = children
+        self.combine = combine
+        self.results = []
+
+
 def ParseExpressionSubTree(ctx):
+    # builds the expression of ctx without recursion: the contexts waiting for their children are
+    # kept on an explicit stack, so deeply nested expressions (like long string concatenations)
+    # don't hit the recursion limit of python.
+    stack = []
+    value = startExpression(ctx)
+
+    while True:
+        if type(value) == Pending:
+            stack.append(value)
+        elif not stack:
+            return value
+        else:
+            stack[-1].results.append(value)
+
+        frame = stack[-1]
+        if len(frame.results) < len(frame.children):
+            value = startExpression(frame.children[len(frame.results)])
+        else:
+            stack.pop()
+            value = frame.combine(*frame.results)
+
+
+def startExpression(ctx):
+    # returns the expression of ctx, or a Pending expression if it needs the expressions of its children.
     if ctx is None:
         return None
 
@@ -17,194 +54,198 @@ def ParseExpressionSubTree(ctx):
 
     # now, based on the type of the context (ctx), we create the related expression,
     # such as BinaryExpr, AssignExpr, or ...
+    builder = EXPRESSION_BUILDERS.get(type(ctx))
+    if builder is not None:
+        return builder(ctx)
 
-    if type(ctx) == TerminalNodeImpl:
-        return ctx.getText()
+    if ctx.getChildCount() == 3:
+        return buildBinaryExpr(ctx)
 
-    if type(ctx) == Java20Parser.ShiftExpressionContext:
-        return BinaryExpr(
-            Pos(ctx.start.line, ctx.start.column),
-            ParseExpressionSubTree(ctx.getChild(0)),
-            ctx.getChild(1).getText() + ctx.getChild(2).getText(),
-            ParseExpressionSubTree(ctx.getChild(3)),
-        )
+    return None
 
-    if type(ctx) == Java20Parser.AndExpressionContext:
-        return BinaryExpr(
-            Pos(ctx.start.line, ctx.start.column),
-            ParseExpressionSubTree(ctx.getChild(0)),
-            "&",
-            ParseExpressionSubTree(ctx.getChild(2)),
-        )
 
-    if type(ctx) == Java20Parser.AssignmentContext:
-        return AssignExpr(
-            Pos(ctx.start.line, ctx.start.column),
-            ctx.getChild(1).getText(),
-            ParseExpressionSubTree(ctx.getChild(0)),
-            ParseExpressionSubTree(ctx.getChild(2)),
-        )
+def pos(ctx):
+    return Pos(ctx.start.line, ctx.start.column)
 
-    if type(ctx) == Java20Parser.ConditionalExpressionContext:
-        return ConditionalExpr(
-            Pos(ctx.start.line, ctx.start.column),
-            ParseExpressionSubTree(ctx.getChild(0)),
-            ParseExpressionSubTree(ctx.getChild(2)),
-            ParseExpressionSubTree(ctx.getChild(4)),
-        )
 
-    if type(ctx) == Java20Parser.MethodInvocationContext:
+def contextText(ctx):
+    # same as ctx.getText(), but joins the text of the leaves in one pass instead of
+    # one StringIO per context of the subtree (primaries like a[i + 1] or (a + b) can be large)
+    texts = []
+    stack = [ctx]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, TerminalNode):
+            texts.append(node.symbol.text)
+        elif node.children:
+            stack.extend(reversed(node.children))
+    return "".join(texts)
+
+
+def buildTerminal(ctx):
+    return ctx.getText()
+
+
+def buildShiftExpr(ctx):
+    return Pending(
+        [ctx.getChild(0), ctx.getChild(3)],
+        lambda lhs, rhs: BinaryExpr(pos(ctx), lhs, ctx.getChild(1).getText() + ctx.getChild(2).getText(), rhs)
+    )
+
+
+def buildAndExpr(ctx):
+    return Pending(
+        [ctx.getChild(0), ctx.getChild(2)],
+        lambda lhs, rhs: BinaryExpr(pos(ctx), lhs, "&", rhs)
+    )
+
+
+def buildAssignExpr(ctx):
+    return Pending(
+        [ctx.getChild(0), ctx.getChild(2)],
+        lambda lhs, rhs: AssignExpr(pos(ctx), ctx.getChild(1).getText(), lhs, rhs)
+    )
+
+
+def buildConditionalExpr(ctx):
+    return Pending(
+        [ctx.getChild(0), ctx.getChild(2), ctx.getChild(4)],
+        lambda cond, trueExpr, falseExpr: ConditionalExpr(pos(ctx), cond, trueExpr, falseExpr)
+    )
+
+
+def buildCallExpr(ctx):
+    try:
+        c = CallExpr(
+            pos(ctx),
+            ctx.typeName().getText(),
+            ctx.Identifier().getText()
+        )
+    except:
         try:
             c = CallExpr(
-                Pos(ctx.start.line, ctx.start.column),
-                ctx.typeName().getText(),
-                ctx.Identifier().getText()
+                pos(ctx),
+                "",
+                ctx.methodName().getText()
             )
         except:
             try:
                 c = CallExpr(
-                    Pos(ctx.start.line, ctx.start.column),
-                    "",
-                    ctx.methodName().getText()
+                    pos(ctx),
+                    ctx.primary().getText(),
+                    ctx.Identifier().getText()
                 )
             except:
-                try:
+                if "super." in ctx.getText():
                     c = CallExpr(
-                        Pos(ctx.start.line, ctx.start.column),
-                        ctx.primary().getText(),
+                        pos(ctx),
+                        "super",
                         ctx.Identifier().getText()
                     )
-                except:
-                    if "super." in ctx.getText():
-                        c = CallExpr(
-                            Pos(ctx.start.line, ctx.start.column),
-                            "super",
-                            ctx.Identifier().getText()
-                        )
-
-        if ctx.argumentList() is not None:
-            for arg in ctx.argumentList().expression():
-                c.args.append(ParseExpressionSubTree(arg))
-        return c
 
-    if type(ctx) == Java20Parser.PrimaryNoNewArrayContext:
-        return ctx.getText()
+    call = c
+    if ctx.argumentList() is None:
+        return call
 
-    if type(ctx) == Java20Parser.CastExpression1Context:
-        return CastExpr(
-            Pos(ctx.start.line, ctx.start.column),
-            ParseExpressionSubTree(ctx.getChild(3)),
-            ctx.primitiveType().getText()
-        )
+    def combine(*args):
+        call.args.extend(args)
+        return call
 
-    if type(ctx) == Java20Parser.CastExpression2Context:
-        return CastExpr(
-            Pos(ctx.start.line, ctx.start.column),
-            ParseExpressionSubTree(ctx.getChild(3)),
-            ctx.referenceType().getText()
-        )
+    return Pending(ctx.argumentList().expression(), combine)
 
-    if type(ctx) == Java20Parser.UnqualifiedClassInstanceCreationExpressionContext:
-        try:
-            if ctx.getChildCount() == 4:
-                return MallocExpr(
-                    Pos(ctx.start.line, ctx.start.column),
-                    ctx.getChild(1).getText()
-                )
-            else:
-                m = MallocExpr(
-                    Pos(ctx.start.line, ctx.start.column),
-                    ctx.getChild(1).getText()
-                )
 
-                for arg in ctx.argumentList().expression():
-                    m.args.append(ParseExpressionSubTree(arg))
-                return m
-        except:
-            return re.sub(r'\([^)]*\)', '', ctx.getText())
-
-    elif ctx.getChildCount() == 2:
-        if type(ctx) == Java20Parser.PostfixExpression2Context:
-            if ctx.pfE().getText() == "++":
-                return UnaryExpr(
-                    Pos(ctx.start.line, ctx.start.column),
-                    UnaryExpr.Type.POST_INC,
-                    ctx.expressionName().getText()
-                )
-            elif ctx.pfE().getText() == "--":
-                u = UnaryExpr(
-                    Pos(ctx.start.line, ctx.start.column),
-                    UnaryExpr.Type.POST_DEC,
-                    ctx.expressionName().getText()
-                )
-                return u
+def buildPrimaryNoNewArray(ctx):
+    return contextText(ctx)
 
-        elif type(ctx) == Java20Parser.PostIncrementExpressionContext:
-            return UnaryExpr(
-                Pos(ctx.start.line, ctx.start.column),
-                UnaryExpr.Type.POST_INC,
-                ParseExpressionSubTree(ctx.getChild(0))
-            )
 
-        elif type(ctx) == Java20Parser.PostDecrementExpressionContext:
-            return UnaryExpr(
-                Pos(ctx.start.line, ctx.start.column),
-                UnaryExpr.Type.POST_DEC,
-                ParseExpressionSubTree(ctx.getChild(0))
-            )
+def buildCastExpr1(ctx):
+    return Pending(
+        [ctx.getChild(3)],
+        lambda expr: CastExpr(pos(ctx), expr, ctx.primitiveType().getText())
+    )
 
-        elif type(ctx) == Java20Parser.UnaryExpression3Context:
-            return UnaryExpr(
-                Pos(ctx.start.line, ctx.start.column),
-                UnaryExpr.Type.POS,
-                ParseExpressionSubTree(ctx.getChild(1))
-            )
 
-        elif type(ctx) == Java20Parser.UnaryExpression4Context:
-            return UnaryExpr(
-                Pos(ctx.start.line, ctx.start.column),
-                UnaryExpr.Type.NEG,
-                ParseExpressionSubTree(ctx.getChild(1))
-            )
+def buildCastExpr2(ctx):
+    return Pending(
+        [ctx.getChild(3)],
+        lambda expr: CastExpr(pos(ctx), expr, ctx.referenceType().getText())
+    )
 
-        elif type(ctx) == Java20Parser.UnaryExpression6Context:
-            return UnaryExpr(
-                Pos(ctx.start.line, ctx.start.column),
-                UnaryExpr.Type.PRE_INC,
-                ParseExpressionSubTree(ctx.getChild(1))
-            )
 
-        elif type(ctx) == Java20Parser.UnaryExpression7Context:
-            return UnaryExpr(
-                Pos(ctx.start.line, ctx.start.column),
-                UnaryExpr.Type.PRE_DEC,
-                ParseExpressionSubTree(ctx.getChild(1))
+def buildMallocExpr(ctx):
+    # the arguments are built inside the try: any failure falls back to the text of the expression
+    try:
+        if ctx.getChildCount() == 4:
+            return MallocExpr(
+                pos(ctx),
+                ctx.getChild(1).getText()
             )
-
-        elif type(ctx) == Java20Parser.UnaryExpression9Context:
-            return UnaryExpr(
-                Pos(ctx.start.line, ctx.start.column),
-                UnaryExpr.Type.BIT_NOT,
-                ParseExpressionSubTree(ctx.getChild(1))
+        else:
+            m = MallocExpr(
+                pos(ctx),
+                ctx.getChild(1).getText()
             )
 
-        elif type(ctx) == Java20Parser.UnaryExpression10Context:
-            return UnaryExpr(
-                Pos(ctx.start.line, ctx.start.column),
-                UnaryExpr.Type.LOGIC_NOT,
-                ParseExpressionSubTree(ctx.getChild(1))
-            )
+            for arg in ctx.argumentList().expression():
+                m.args.append(ParseExpressionSubTree(arg))
+            return m
+    except:
+        return re.sub(r'\([^)]*\)', '', ctx.getText())
 
-    elif ctx.getChildCount() == 3:
-        if type(ctx) == Java20Parser.StatementExpressionListContext:
-            exprList = []
-            for expr in ctx.statementExpression():
-                exprList.append(ParseExpressionSubTree(expr))
-            return exprList
-        else:
-            return BinaryExpr(
-                Pos(ctx.start.line, ctx.start.column),
-                ParseExpressionSubTree(ctx.getChild(0)),
-                ctx.getChild(1).getText(),
-                ParseExpressionSubTree(ctx.getChild(2))
-            )
+
+def buildPostfixExpr(ctx):
+    if ctx.getChildCount() != 2:
+        return None
+    if ctx.pfE().getText() == "++":
+        return UnaryExpr(pos(ctx), UnaryExpr.Type.POST_INC, ctx.expressionName().getText())
+    elif ctx.pfE().getText() == "--":
+        return UnaryExpr(pos(ctx), UnaryExpr.Type.POST_DEC, ctx.expressionName().getText())
+    return None
+
+
+def unaryBuilder(op, child):
+    # builder of the unary expressions made of an operator and one operand (the child-th child)
+    def build(ctx):
+        if ctx.getChildCount() != 2:
+            return None
+        return Pending([ctx.getChild(child)], lambda expr: UnaryExpr(pos(ctx), op, expr))
+    return build
+
+
+def buildStatementExpressionList(ctx):
+    if ctx.getChildCount() != 3:
+        return None
+    return Pending(ctx.statementExpression(), lambda *exprList: list(exprList))
+
+
+def buildBinaryExpr(ctx):
+    return Pending(
+        [ctx.getChild(0), ctx.getChild(2)],
+        lambda lhs, rhs: BinaryExpr(pos(ctx), lhs, ctx.getChild(1).getText(), rhs)
+    )
+
+
+# the expression builder of each context type,
+# any other context with 3 children is a binary expression (see startExpression).
+EXPRESSION_BUILDERS = {
+    TerminalNodeImpl: buildTerminal,
+    Java20Parser.ShiftExpressionContext: buildShiftExpr,
+    Java20Parser.AndExpressionContext: buildAndExpr,
+    Java20Parser.AssignmentContext: buildAssignExpr,
+    Java20Parser.ConditionalExpressionContext: buildConditionalExpr,
+    Java20Parser.MethodInvocationContext: buildCallExpr,
+    Java20Parser.PrimaryNoNewArrayContext: buildPrimaryNoNewArray,
+    Java20Parser.CastExpression1Context: buildCastExpr1,
+    Java20Parser.CastExpression2Context: buildCastExpr2,
+    Java20Parser.UnqualifiedClassInstanceCreationExpressionContext: buildMallocExpr,
+    Java20Parser.PostfixExpression2Context: buildPostfixExpr,
+    Java20Parser.PostIncrementExpressionContext: unaryBuilder(UnaryExpr.Type.POST_INC, 0),
+    Java20Parser.PostDecrementExpressionContext: unaryBuilder(UnaryExpr.Type.POST_DEC, 0),
+    Java20Parser.UnaryExpression3Context: unaryBuilder(UnaryExpr.Type.POS, 1),
+    Java20Parser.UnaryExpression4Context: unaryBuilder(UnaryExpr.Type.NEG, 1),
+    Java20Parser.UnaryExpression6Context: unaryBuilder(UnaryExpr.Type.PRE_INC, 1),
+    Java20Parser.UnaryExpression7Context: unaryBuilder(UnaryExpr.Type.PRE_DEC, 1),
+    Java20Parser.UnaryExpression9Context: unaryBuilder(UnaryExpr.Type.BIT_NOT, 1),
+    Java20Parser.UnaryExpression10Context: unaryBuilder(UnaryExpr.Type.LOGIC_NOT, 1),
+    Java20Parser.StatementExpressionListContext: buildStatementExpressionList,
+}
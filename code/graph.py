@@ -0,0 +1,238 @@
+from array import array
+
+
+# label codes of the edge label array
+NO_LABEL = -2  # the edge has no "label" attribute at all
+NONE_LABEL = -1  # the edge has a "label" attribute set to None
+
+# default of add_edge(), "no label given" is not the same as label=None
+noLabel = object()
+
+
+def edgeKey(u, v):
+    # one int per edge instead of a (u, v) tuple, node ids are block indices (< 2**32)
+    return (u << 32) | v
+
+
+class CFGraph:
+    def __init__(self):
+        """
+        A compact directed graph with integer node ids, used to build the CFG of a method.
+
+        It implements the part of the nx.DiGraph interface used by SourceLevelCFG (same iteration
+        order of nodes, edges and neighbours), but the edges are stored in flat arrays
+        (source, target, label code) instead of one attribute dict per edge, and every node only
+        keeps the ids of its input and output edges. toNetworkx() builds a real nx.DiGraph for
+        callers that need one, toCSR() exports the graph as compressed sparse rows.
+        """
+        # nodes, in insertion order: a removed node leaves a hole (-1) in nodeIds
+        self.nodeIds = array("l")
+        self.slots = {}
+        self.succ = []
+        self.pred = []
+
+        # edges: a removed edge leaves a hole (-1) in src/dst
+        self.src = array("l")
+        self.dst = array("l")
+        self.labelCodes = array("l")
+        self.edgeIds = {}
+
+        # every distinct label is stored once
+        self.labels = []
+        self.labelIndex = {}
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __contains__(self, node):
+        return node in self.slots
+
+    def __iter__(self):
+        return iter(self.nodes)
+
+    @property
+    def nodes(self):
+        return [n for n in self.nodeIds if n != -1]
+
+    @property
+    def edges(self):
+        return [(u, v) for u, v, _ in self.edgeItems()]
+
+    def edgeItems(self):
+        # (source, target, label code) of every edge, in the edge order of networkx
+        for slot, n in enumerate(self.nodeIds):
+            if n != -1:
+                for e in self.succ[slot]:
+                    yield n, self.dst[e], self.labelCodes[e]
+
+    def number_of_nodes(self):
+        return len(self.slots)
+
+    def number_of_edges(self):
+        return len(self.edgeIds)
+
+    def encodeLabel(self, label):
+        if label is noLabel:
+            return NO_LABEL
+        if label is None:
+            return NONE_LABEL
+        code = self.labelIndex.get(label)
+        if code is None:
+            code = len(self.labels)
+            self.labels.append(label)
+            self.labelIndex[label] = code
+        return code
+
+    def decodeLabel(self, code):
+        if code == NO_LABEL:
+            return noLabel
+        if code == NONE_LABEL:
+            return None
+        return self.labels[code]
+
+    def add_node(self, node):
+        if node in self.slots:
+            return
+        self.slots[node] = len(self.nodeIds)
+        self.nodeIds.append(node)
+        self.succ.append([])
+        self.pred.append([])
+
+    def add_edge(self, u, v, label=noLabel):
+        e = self.edgeIds.get(edgeKey(u, v))
+        if e is not None:
+            # like networkx, adding an existing edge only updates its attributes
+            if label is not noLabel:
+                self.labelCodes[e] = self.encodeLabel(label)
+            return
+
+        self.add_node(u)
+        self.add_node(v)
+        e = len(self.src)
+        self.src.append(u)
+        self.dst.append(v)
+        self.labelCodes.append(self.encodeLabel(label))
+        self.edgeIds[edgeKey(u, v)] = e
+        self.succ[self.slots[u]].append(e)
+        self.pred[self.slots[v]].append(e)
+
+    def remove_edge(self, u, v):
+        e = self.edgeIds.pop(edgeKey(u, v))
+        self.succ[self.slots[u]].remove(e)
+        self.pred[self.slots[v]].remove(e)
+        self.src[e] = -1
+        self.dst[e] = -1
+
+    def remove_node(self, node):
+        slot = self.slots[node]
+        for e in list(self.succ[slot]):
+            self.remove_edge(node, self.dst[e])
+        for e in list(self.pred[slot]):
+            self.remove_edge(self.src[e], node)
+        del self.slots[node]
+        self.nodeIds[slot] = -1
+        self.succ[slot] = None
+        self.pred[slot] = None
+
+    def has_node(self, node):
+        return node in self.slots
+
+    def has_edge(self, u, v):
+        return edgeKey(u, v) in self.edgeIds
+
+    def get_edge_data(self, u, v, default=None):
+        e = self.edgeIds.get(edgeKey(u, v))
+        if e is None:
+            return default
+        label = self.decodeLabel(self.labelCodes[e])
+        return {} if label is noLabel else {"label": label}
+
+    def out_edges(self, node):
+        return [(node, self.dst[e]) for e in self.succ[self.slots[node]]]
+
+    def in_edges(self, node):
+        return [(self.src[e], node) for e in self.pred[self.slots[node]]]
+
+    def successors(self, node):
+        return [self.dst[e] for e in self.succ[self.slots[node]]]
+
+    def out_degree(self, node=None):
+        if node is not None:
+            return len(self.succ[self.slots[node]])
+        return [(n, len(self.succ[self.slots[n]])) for n in self.nodeIds if n != -1]
+
+    def in_degree(self, node=None):
+        if node is not None:
+            return len(self.pred[self.slots[node]])
+        return [(n, len(self.pred[self.slots[n]])) for n in self.nodeIds if n != -1]
+
+    def update(self, other):
+        # merges other into this graph in place, like nx.DiGraph.update(): the label of an edge
+        # that exists in both graphs is taken from other, unless the edge of other has no label.
+        for n in other.nodes:
+            self.add_node(n)
+        for u, v, code in other.edgeItems():
+            self.add_edge(u, v, other.decodeLabel(code))
+
+    def copy(self):
+        g = CFGraph()
+        g.update(self)
+        return g
+
+    def hasPath(self, source, target):
+        if source == target:
+            return source in self.slots
+        visited = {source}
+        stack = [source]
+        while stack:
+            for child in self.successors(stack.pop()):
+                if child == target:
+                    return True
+                if child not in visited:
+                    visited.add(child)
+                    stack.append(child)
+        return False
+
+    def dfsNodes(self, source):
+        # nodes reachable from source, in depth-first preorder (the node order of nx.dfs_tree)
+        visited = {source: None}
+        stack = [iter(self.successors(source))]
+        while stack:
+            for child in stack[-1]:
+                if child not in visited:
+                    visited[child] = None
+                    stack.append(iter(self.successors(child)))
+                    break
+            else:
+                stack.pop()
+        return list(visited)
+
+    def toNetworkx(self):
+        import networkx as nx
+
+        g = nx.DiGraph()
+        g.add_nodes_from(self.nodes)
+        for u, v, code in self.edgeItems():
+            label = self.decodeLabel(code)
+            if label is noLabel:
+                g.add_edge(u, v)
+            else:
+                g.add_edge(u, v, label=label)
+        return g
+
+    def toCSR(self):
+        # compressed sparse rows: row i is the node nodeIds[i], its successors are the rows
+        # indices[indptr[i]:indptr[i + 1]], and labels holds the label of each of these edges
+        # (None for an edge without label).
+        nodeIds = array("l", self.nodes)
+        rows = {n: i for i, n in enumerate(nodeIds)}
+        indptr = array("l", [0])
+        indices = array("l")
+        labels = []
+        for n in nodeIds:
+            for e in self.succ[self.slots[n]]:
+                indices.append(rows[self.dst[e]])
+                label = self.decodeLabel(self.labelCodes[e])
+                labels.append(None if label is noLabel else label)
+            indptr.append(len(indices))
+        return nodeIds, indptr, indices, labels
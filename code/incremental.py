@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+from enum import Enum
+
+from code.ast import Pos
+from code.cache import toolVersion
+
+
+# attributes that don't change the generated CFG: the scope id of a block is its position (already
+# hashed) and the fields of a block repeat its declaration statements
+IGNORED_ATTRIBUTES = {"scope", "fields"}
+
+MANIFEST_NAME = ".methods.json"
+
+
+def updateFingerprint(h, node):
+    if isinstance(node, Pos):
+        h.update(f"@{node.line}:{node.column}".encode("utf8"))
+    elif node is None or isinstance(node, (str, int, float, bool)):
+        h.update(repr(node).encode("utf8"))
+    elif isinstance(node, Enum):
+        h.update(str(node).encode("utf8"))
+    elif isinstance(node, (list, tuple)):
+        h.update(b"[")
+        for item in node:
+            updateFingerprint(h, item)
+            h.update(b",")
+        h.update(b"]")
+    elif isinstance(node, dict):
+        h.update(b"{")
+        for key, value in node.items():
+            updateFingerprint(h, key)
+            h.update(b":")
+            updateFingerprint(h, value)
+            h.update(b",")
+        h.update(b"}")
+    else:
+        h.update(type(node).__name__.encode("utf8"))
+        h.update(b"(")
+        # the AST nodes are slotted classes
+        for name in type(node).__slots__:
+            if name in IGNORED_ATTRIBUTES:
+                continue
+            h.update(name.encode("utf8"))
+            h.update(b"=")
+            updateFingerprint(h, getattr(node, name))
+            h.update(b",")
+        h.update(b")")
+
+
+def methodFingerprint(ast, method, outputName):
+    # everything the outputs of a method depend on: its body (structure, statement text and positions),
+    # its name, class and package (the graph title), the output name and the tool version.
+    h = hashlib.sha256()
+    h.update(toolVersion().encode("utf8"))
+    for value in (outputName, ast.package, method.scope, method.name, method.retType):
+        updateFingerprint(h, value)
+    updateFingerprint(h, method.bodyBlock)
+    return h.hexdigest()
+
+
+def manifestFiles(outputDir):
+    # the names of the output files of the methods in the manifest of outputDir, and of the manifest itself
+    try:
+        with open(os.path.join(outputDir, MANIFEST_NAME)) as manifestFile:
+            manifest = json.load(manifestFile)
+    except (OSError, ValueError):
+        return []
+    names = [MANIFEST_NAME]
+    for outputName in manifest.get("methods", {}):
+        names.extend(f"{outputName}{ext}" for ext in manifest.get("extensions", []))
+    return [name for name in names if os.path.exists(os.path.join(outputDir, name))]
+
+
+class MethodManifest:
+    def __init__(self, outputDir, extensions):
+        """
+        The fingerprints of the methods whose outputs are in outputDir, stored next to them.
+
+        A method is up to date if its fingerprint didn't change since the last run and all of its
+        output files (one per extension) still exist. save() writes the fingerprints of this run and
+        removes the outputs of the methods that are gone.
+        """
+        self.outputDir = outputDir
+        self.extensions = extensions
+        self.previous = {}
+        self.current = {}
+
+        try:
+            with open(os.path.join(outputDir, MANIFEST_NAME)) as manifestFile:
+                manifest = json.load(manifestFile)
+            if manifest.get("extensions") == list(extensions):
+                self.previous = manifest.get("methods", {})
+        except (OSError, ValueError):
+            pass
+
+    def outputFiles(self, outputName):
+        # outputName is the output file name without directory and extension, see SourceLevelCFG.getOutputFilename
+        return [os.path.join(self.outputDir, f"{outputName}{ext}") for ext in self.extensions]
+
+    def isUpToDate(self, outputName, fingerprint):
+        if self.previous.get(outputName) != fingerprint:
+            return False
+        return all(os.path.exists(f) for f in self.outputFiles(outputName))
+
+    def record(self, outputName, fingerprint):
+        self.current[outputName] = fingerprint
+
+    def save(self):
+        for outputName in self.previous:
+            if outputName not in self.current:
+                for f in self.outputFiles(outputName):
+                    if os.path.exists(f):
+                        os.remove(f)
+
+        with open(os.path.join(self.outputDir, MANIFEST_NAME), "w") as manifestFile:
+            json.dump({"extensions": list(self.extensions), "methods": self.current}, manifestFile, indent=4)
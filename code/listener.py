@@ -1,7 +1,5 @@
-import uuid
-
 from code.ast import *
-from code.cfg import SourceLevelCFG
+from code.cfg import MethodSink, OutputMode, SourceLevelCFG
 from code.expressions import ParseExpressionSubTree
 from gen.Java20Parser import Java20Parser
 from gen.Java20ParserListener import Java20ParserListener
@@ -30,112 +28,65 @@ class WalkerState:
         self.CurrentMethod = None
         self.CurrentSwitchCase = None
         self.StmtStack = []
+        # the number of statements popStmtStack couldn't place: the statements of an initializer block
+        # (there is no current method) and the statements of a switch before its first case
+        self.PopFailures = 0
 
 
 class ASTListener(Java20ParserListener):
-    def __init__(self,output_dir):
+    def __init__(self,output_dir, outputMode=OutputMode.PDF, incremental=False, stream=None):
         self.output_dir = output_dir
+        self.outputMode = outputMode
+        self.incremental = incremental
         self.ast = AST()
         self.state = WalkerState()
 
+        # stream: None to generate the CFGs once the whole file is walked, "inline" to generate the CFG
+        # of each method as soon as it is walked, or "thread" to do it in a background thread.
+        self.sink = None
+        if stream is not None:
+            self.sink = MethodSink(
+                SourceLevelCFG(self.ast, self.output_dir, self.outputMode, self.incremental),
+                threaded=stream == "thread"
+            )
+
+    def addScope(self, blockStmt):
+        # the scope id of a block is its position, packed into an int (see Pos): unique in the file, the same
+        # in every run, and also when the methods of the file are parsed separately (see code/splitter.py)
+        # the block belongs to the current method, if any, so it is released with the method (see MethodSink)
+        blockStmt.scope = int(blockStmt.pos)
+        scopes = self.state.CurrentMethod.scopes if self.state.CurrentMethod is not None else self.ast.scopes
+        scopes[blockStmt.scope] = blockStmt
+
     def popStmtStack(self):
-        # this method attempts to pop the last statement from the stack.
-        # depending on the type and situation,
-        # it either sets the scope and fields or appends the top of the stack statement
-        # to the body of the current method, switch case, or any other relevant bodies.
+        # this method pops the last statement from the stack and gives it to the statement (or the method body)
+        # it belongs to: a block is merged into the body of its for, if, while, do-while or switch case
+        # (see acceptBlock in code/ast.py), any other statement is appended to the related body.
+        state = self.state
 
         # if no stmts on stack, do nothing
-        if len(self.state.StmtStack) == 0:
+        if not state.StmtStack:
             return
-        else:
-            try:
-                # pop last stmt
-                ss = self.state.StmtStack.pop()
-
-                # last stmts on stack should pop and add to current method body
-                if len(self.state.StmtStack) == 0:
-                    self.state.CurrentMethod.bodyBlock.body.append(ss)
-                    return
-
-                # get last stmt in stack
-                topOfStack = self.state.StmtStack[-1]
-
-                if type(ss) == BlockStmt:
-                    # if it's a block stmt and it's inside a for stmt:
-                    if type(topOfStack) == BasicForStmt:
-                        # add block stmts to for stmt body
-                        topOfStack.bodyBlock.body.extend(ss.body)
-                        # set scope of block stmt to for stmt body
-                        topOfStack.bodyBlock.scope = ss.scope
-                        # merge fields of block stmt and for stmt and set the result to for stmt body
-                        tmp = topOfStack.bodyBlock.fields
-                        topOfStack.bodyBlock.fields = {**tmp, **ss.fields}
-
-                    # if it's a block stmt and it's inside a switch stmt:
-                    elif type(topOfStack) == SwitchStmt:
-                        # add block stmts to current switch case body
-                        topOfStack.caseBlocks[self.state.CurrentSwitchCase].body = ss.body
-                        # set scope of block stmt to current switch case body
-                        topOfStack.caseBlocks[self.state.CurrentSwitchCase].scope = ss.scope
-                        # merge fields of block stmt and current switch case and set the result to current switch case
-                        tmp = topOfStack.caseBlocks[self.state.CurrentSwitchCase].fields
-                        topOfStack.caseBlocks[self.state.CurrentSwitchCase].fields = {**tmp, **ss.fields}
-
-                    elif type(topOfStack) == BlockStmt:
-                        # if it's a block stmt and it's inside another block stmt add it to parent body block
-                        topOfStack.body.append(ss)
-
-                    # if it's a block stmt and it's inside an if stmt:
-                    elif type(topOfStack) == IfStmt:
-                        if topOfStack.currentBlock == "bodyBlock":
-                            topOfStack.bodyBlock.body = ss.body
-                            topOfStack.bodyBlock.scope = ss.scope
-                            tmp = topOfStack.bodyBlock.fields
-                            topOfStack.bodyBlock.fields = {**tmp, **ss.fields}
-                        else:
-                            topOfStack.elseBlock.body = ss.body
-                            topOfStack.elseBlock.scope = ss.scope
-                            tmp = topOfStack.elseBlock.fields
-                            topOfStack.elseBlock.fields = {**tmp, **ss.fields}
-
-                    elif type(topOfStack) == WhileStmt:
-                        topOfStack.bodyBlock.body = ss.body
-                        topOfStack.bodyBlock.scope = ss.scope
-                        tmp = topOfStack.bodyBlock.fields
-                        topOfStack.bodyBlock.fields = {**tmp, **ss.fields}
-
-                    elif type(topOfStack) == DoWhileStmt:
-                        topOfStack.bodyBlock.body = ss.body
-                        topOfStack.bodyBlock.scope = ss.scope
-                        tmp = topOfStack.bodyBlock.fields
-                        topOfStack.bodyBlock.fields = {**tmp, **ss.fields}
-
-                    return
-
-                # if it's not a block stmt, add topOfStack to related body block
-
-                if type(topOfStack) == BlockStmt:
-                    topOfStack.body.append(ss)
-
-                elif type(topOfStack) == BasicForStmt:
-                    topOfStack.bodyBlock.body.append(ss)
-
-                if type(topOfStack) == SwitchStmt:
-                    topOfStack.caseBlocks[self.state.CurrentSwitchCase].body.append(ss)
 
-                elif type(topOfStack) == IfStmt:
-                    if topOfStack.currentBlock == "bodyBlock":
-                        topOfStack.bodyBlock.body.append(ss)
-                    else:
-                        topOfStack.elseBlock.body.append(ss)
+        # pop last stmt
+        ss = state.StmtStack.pop()
 
-                elif type(topOfStack) == WhileStmt:
-                    topOfStack.bodyBlock.body.append(ss)
+        # last stmts on stack should pop and add to current method body
+        if not state.StmtStack:
+            if state.CurrentMethod is None:
+                state.PopFailures += 1
+                return
+            state.CurrentMethod.bodyBlock.acceptStmt(ss)
+            return
 
-                elif type(topOfStack) == DoWhileStmt:
-                    topOfStack.bodyBlock.body.append(ss)
-            except:
-                pass
+        parent = state.StmtStack[-1]
+        if type(parent) == SwitchStmt and state.CurrentSwitchCase not in parent.caseBlocks:
+            state.PopFailures += 1
+            return
+        if type(ss) == BlockStmt:
+            parent.acceptBlock(ss, state.CurrentSwitchCase)
+        else:
+            parent.acceptStmt(ss, state.CurrentSwitchCase)
 
     def enterExpressionStatement(self, ctx: Java20Parser.ExpressionStatementContext):
         exprStmt = ExpressionStmt(
@@ -306,8 +257,22 @@ class ASTListener(Java20ParserListener):
     def exitMethodDeclaration(self, ctx: Java20Parser.MethodDeclarationContext):
         # after exiting method declaration in syntax tree, add the method to the AST declaration list.
         self.ast.decls.append(self.state.CurrentMethod)
+        self.emitMethod(ctx)
         self.state.CurrentMethod = None
 
+    def emitMethod(self, ctx):
+        # in streaming mode, the finished method goes to the CFG sink right away (which releases its body
+        # once the CFG is written), and the parse tree of the method is not needed anymore.
+        if self.sink is None:
+            return
+        self.sink.submit(len(self.ast.decls) - 1, self.state.CurrentMethod)
+        ctx.children = None
+
+    def abort(self):
+        # the walk failed
+        if self.sink is not None:
+            self.sink.abort()
+
     def enterConstructorDeclaration(self, ctx:Java20Parser.ConstructorDeclarationContext):
         # get method name and return type
         methodName = ctx.constructorDeclarator().getText()
@@ -333,6 +298,7 @@ class ASTListener(Java20ParserListener):
     def exitConstructorDeclaration(self, ctx:Java20Parser.ConstructorDeclarationContext):
         # after exiting method declaration in syntax tree, add the method to the AST declaration list.
         self.ast.decls.append(self.state.CurrentMethod)
+        self.emitMethod(ctx)
         self.state.CurrentMethod = None
 
     def enterFieldDeclaration(self, ctx: Java20Parser.FieldDeclarationContext):
@@ -468,7 +434,7 @@ class ASTListener(Java20ParserListener):
         if type(ctx.parentCtx) == Java20Parser.MethodBodyContext:
             self.state.CurrentMethod.bodyBlock.pos = Pos(ctx.start.line, ctx.start.column)
             self.state.CurrentMethod.bodyBlock.scope = self.state.CurrentMethod.name
-            self.ast.scopes[self.state.CurrentMethod.name] = self.state.CurrentMethod.bodyBlock
+            self.state.CurrentMethod.scopes[self.state.CurrentMethod.name] = self.state.CurrentMethod.bodyBlock
         else:
             # else if we enter a block and the parent context was not MethodBodyContext
             if len(self.state.StmtStack) != 0:
@@ -487,8 +453,7 @@ class ASTListener(Java20ParserListener):
             )
 
             # create new scope
-            blockStmt.scope = str(uuid.uuid4())
-            self.ast.scopes[blockStmt.scope] = blockStmt
+            self.addScope(blockStmt)
 
             # append block stmt to stack
             self.state.StmtStack.append(blockStmt)
@@ -569,7 +534,8 @@ class ASTListener(Java20ParserListener):
 
             counterVar = Field(
                 Pos(v.start.line, v.start.column),
-                "_" + str(uuid.uuid4())[:8],
+                # named after the position of the loop variable: unique in the file and the same in every run
+                f"_{v.start.line}_{v.start.column}",
                 "int",
                 Field.Type.LOCAL_VAR,
                 "0"
@@ -763,11 +729,8 @@ class ASTListener(Java20ParserListener):
                 Pos(ctx.start.line, ctx.start.column)
             )
 
-            # set the scope of the block as UUID.
-            blockStmt.scope = str(uuid.uuid4())
-
             # add scope of the block to the AST
-            self.ast.scopes[blockStmt.scope] = blockStmt
+            self.addScope(blockStmt)
 
             # for each case label:
             for c in ctx.switchLabel():
@@ -787,6 +750,11 @@ class ASTListener(Java20ParserListener):
         self.state.CurrentSwitchCase = None
 
     def exitCompilationUnit(self, ctx: Java20Parser.CompilationUnitContext):
+        # in streaming mode the CFGs are already generated, wait for the last ones.
+        if self.sink is not None:
+            self.sink.close()
+            return
+
         # after the walker exits the parse tree, run the CFG generator.
-        cfg = SourceLevelCFG(self.ast,self.output_dir)
+        cfg = SourceLevelCFG(self.ast,self.output_dir, self.outputMode, self.incremental)
         cfg.Gen()
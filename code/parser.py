@@ -0,0 +1,129 @@
+import os
+
+from antlr4 import CommonTokenStream, FileStream, InputStream, Token
+from antlr4.atn.PredictionMode import PredictionMode
+from antlr4.error.ErrorStrategy import BailErrorStrategy, DefaultErrorStrategy
+from antlr4.error.Errors import ParseCancellationException
+
+from code.listener import MyErrorListener
+from code.timing import getPhaseTimer
+from gen.Java20Lexer import Java20Lexer
+from gen.Java20Parser import Java20Parser
+
+
+def parseCompilationUnit(parser, twoStage=False):
+    return parseRule(parser, parser.compilationUnit, twoStage)
+
+
+def parseRule(parser, rule, twoStage=False):
+    # rule is the method of parser of the start rule (compilationUnit, classBodyDeclaration, ...).
+    #
+    # without twoStage, the input is parsed with full LL prediction,
+    # the slowest (but complete) prediction mode of the ANTLR runtime.
+    #
+    # with twoStage, the input is first parsed with SLL prediction and a bail-out error strategy.
+    # SLL is much faster and is enough for almost all real-world Java code. only if SLL fails
+    # (a real syntax error, or an input that really needs full LL context) the token stream is
+    # rewound and parsed again with full LL prediction and the normal error listener.
+    if not twoStage:
+        parser.removeErrorListeners()
+        parser.addErrorListener(MyErrorListener())
+        parser._errHandler = DefaultErrorStrategy()
+        parser._interp.predictionMode = PredictionMode.LL
+        return rule()
+
+    parser.removeErrorListeners()
+    parser._errHandler = BailErrorStrategy()
+    parser._interp.predictionMode = PredictionMode.SLL
+
+    try:
+        return rule()
+    except ParseCancellationException:
+        pass
+
+    # second stage: rewind and parse with full LL
+    parser.reset()
+    parser.addErrorListener(MyErrorListener())
+    parser._errHandler = DefaultErrorStrategy()
+    parser._interp.predictionMode = PredictionMode.LL
+
+    return rule()
+
+
+class ParserWorker:
+    def __init__(self, twoStage=False):
+        """
+        A long-lived lexer/parser pair that is reused for every file parsed by a process.
+
+        The ANTLR decision DFA is cached on the generated Java20Lexer/Java20Parser classes
+        and is built lazily while parsing, so the first files parsed by a process are much slower
+        than the following ones. warmUp() parses a small corpus to fill the DFA before the real work,
+        and dfaStateCount() shows how far the cache has grown.
+        """
+        self.twoStage = twoStage
+        self.lexer = Java20Lexer(None)
+        self.tokenStream = CommonTokenStream(self.lexer)
+        self.parser = Java20Parser(self.tokenStream)
+        self.filesParsed = 0
+        self.warmedUp = False
+
+    def parse(self, javaFilePath):
+        return self.parseStream(FileStream(javaFilePath, encoding="utf8"))
+
+    def parseStream(self, inputStream, line=1, column=0, rule="compilationUnit"):
+        # point the existing lexer, token stream and parser at the new input
+        # (each setter also resets the state left by the previous file).
+        # line and column are the position of the input in its file, when it is a part of a file
+        # (see code/splitter.py), the tokens get the positions they have in the whole file.
+        self.lexer.inputStream = inputStream
+        self.lexer.line = line
+        self.lexer.column = column
+        self.tokenStream.setTokenSource(self.lexer)
+        self.parser.setTokenStream(self.tokenStream)
+
+        # the parser pulls tokens on demand, so the whole file is tokenized up front
+        # to time lexing and parsing separately.
+        timer = getPhaseTimer()
+        with timer.phase("lex"):
+            self.tokenStream.fill()
+        with timer.phase("parse"):
+            parseTree = parseRule(self.parser, getattr(self.parser, rule), self.twoStage)
+        self.filesParsed += 1
+        return parseTree
+
+    def parseText(self, text, line=1, column=0, rule="compilationUnit"):
+        return self.parseStream(InputStream(text), line, column, rule)
+
+    def atEnd(self):
+        # whether the last parse consumed the whole input
+        return self.parser.getCurrentToken().type == Token.EOF
+
+    def warmUp(self, warmUpDir):
+        # parse every .java file of the warm-up corpus and throw the result away,
+        # syntax errors in the corpus don't matter here.
+        for root, dirs, files in os.walk(warmUpDir):
+            for file in sorted(files):
+                if file.endswith(".java"):
+                    try:
+                        self.parse(os.path.join(root, file))
+                    except Exception:
+                        pass
+        self.warmedUp = True
+
+    def dfaStateCount(self):
+        return {
+            "lexer": sum(len(dfa.states) for dfa in self.lexer._interp.decisionToDFA),
+            "parser": sum(len(dfa.states) for dfa in self.parser._interp.decisionToDFA),
+        }
+
+
+# one parser worker per process, reused by every call of getParserWorker()
+parserWorker = None
+
+
+def getParserWorker(twoStage=False):
+    global parserWorker
+    if parserWorker is None:
+        parserWorker = ParserWorker(twoStage)
+    parserWorker.twoStage = twoStage
+    return parserWorker
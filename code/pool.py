@@ -0,0 +1,28 @@
+import multiprocessing as mp
+import time
+
+
+# imported by the forkserver before it forks the workers: every worker starts with the ATN of the
+# lexer and the parser already deserialized (they are class attributes of the generated classes).
+PRELOAD_MODULES = ["gen.Java20Lexer", "gen.Java20Parser", "code.listener", "code.parser", "code.visitor",
+                   "code.walker"]
+
+
+def defaultStartMethod():
+    # fork/forkserver avoid re-importing the (huge) generated parser in every worker
+    if "forkserver" in mp.get_all_start_methods():
+        return "forkserver"
+    return "spawn"
+
+
+def poolContext(startMethod):
+    # the multiprocessing context of a pool of parsing workers
+    ctx = mp.get_context(startMethod)
+    if startMethod == "forkserver":
+        ctx.set_forkserver_preload(PRELOAD_MODULES)
+    return ctx
+
+
+def timestamp():
+    # the time prefix of the progress lines of a directory run
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time()))
@@ -0,0 +1,107 @@
+import os
+import queue
+import subprocess
+import threading
+import time
+
+from code.timing import getPhaseTimer
+
+
+class RenderQueue:
+    def __init__(self, workers=2, maxPending=64, dotBinary="dot"):
+        """
+        A bounded queue of DOT documents, drained by a pool of threads that each run `dot` as a subprocess.
+
+        submit() blocks while maxPending documents are already waiting (back-pressure, so CFG generation
+        can't run arbitrarily far ahead of rendering), join() waits until everything submitted so far is rendered.
+        """
+        self.pid = os.getpid()
+        self.dotBinary = dotBinary
+        self.queue = queue.Queue(maxsize=maxPending)
+        self.lock = threading.Lock()
+        self.rendered = 0
+        self.errors = []
+        self.threads = []
+
+        for _ in range(max(1, workers)):
+            t = threading.Thread(target=self.drain, daemon=True)
+            t.start()
+            self.threads.append(t)
+
+    def submit(self, source, filename, format="pdf"):
+        # filename is the output file without extension, like graphviz's render()
+        self.queue.put((source, f"{filename}.{format}", format))
+
+    def drain(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+
+            source, outFile, format = item
+            start = time.perf_counter()
+            try:
+                subprocess.run(
+                    [self.dotBinary, f"-T{format}", "-o", outFile],
+                    input=source.encode("utf8"),
+                    capture_output=True,
+                    check=True,
+                )
+                with self.lock:
+                    self.rendered += 1
+            except (OSError, subprocess.CalledProcessError) as e:
+                if isinstance(e, subprocess.CalledProcessError):
+                    e = e.stderr.decode("utf8", "replace").strip() or e
+                with self.lock:
+                    self.errors.append(f"{outFile}: {e}")
+                print(f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time()))} render error: {e} file: '{outFile}'")
+            finally:
+                # background time, it overlaps the phases of the generating thread
+                getPhaseTimer().add("render", time.perf_counter() - start)
+                self.queue.task_done()
+
+    def join(self):
+        # wait for every submitted document and return (and forget) the errors seen so far
+        self.queue.join()
+        with self.lock:
+            errors, self.errors = self.errors, []
+        return errors
+
+    def close(self):
+        errors = self.join()
+        for _ in self.threads:
+            self.queue.put(None)
+        for t in self.threads:
+            t.join()
+        self.threads = []
+        return errors
+
+
+# one render queue per process, see getRenderQueue()
+renderQueue = None
+renderQueueWorkers = 2
+renderQueueMaxPending = 64
+
+
+def configureRenderQueue(workers=2, maxPending=64):
+    global renderQueueWorkers, renderQueueMaxPending
+    renderQueueWorkers = workers
+    renderQueueMaxPending = maxPending
+
+
+def getRenderQueue():
+    global renderQueue
+    # threads don't survive a fork, so a queue inherited from the parent process is not usable
+    if renderQueue is None or renderQueue.pid != os.getpid():
+        renderQueue = RenderQueue(renderQueueWorkers, renderQueueMaxPending)
+    return renderQueue
+
+
+def closeRenderQueue():
+    global renderQueue
+    if renderQueue is None or renderQueue.pid != os.getpid():
+        return []
+    errors = renderQueue.close()
+    renderQueue = None
+    return errors
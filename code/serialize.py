@@ -0,0 +1,308 @@
+import os
+import struct
+import tempfile
+
+from code import ast as astModule
+from code.ast import AST, Pos
+
+
+# a serialized AST: MAGIC, the schema version, the string table, the schema of the node classes
+# (class and attribute names) and the enums, then the AST itself as one prefix-encoded value.
+MAGIC = b"SLCFGAST"
+VERSION = 1
+
+AST_FILE_NAME = "ast.bin"
+
+# the node classes of code/ast.py, serialized with the attributes of their __slots__
+NODE_CLASSES = [
+    astModule.Field, astModule.UnaryExpr, astModule.BinaryExpr, astModule.AssignExpr, astModule.CastExpr,
+    astModule.MallocExpr, astModule.CallExpr, astModule.ConditionalExpr, astModule.ExpressionStmt,
+    astModule.DeclStmt, astModule.ReturnStmt, astModule.BlockStmt, astModule.BreakStmt, astModule.ContinueStmt,
+    astModule.LabeledStmt, astModule.BasicForStmt, astModule.IfStmt, astModule.WhileStmt, astModule.DoWhileStmt,
+    astModule.SwitchStmt, astModule.Method, astModule.Class, AST,
+]
+
+ENUMS = [astModule.Field.Type, astModule.UnaryExpr.Type]
+
+# value tags
+NONE, FALSE, TRUE, INT, STR, POS, FLOAT, LIST, DICT, NODE, REF, ENUM = range(12)
+
+FLOAT_FORMAT = struct.Struct("<d")
+
+
+def writeVarint(out, n):
+    while n > 0x7F:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def readVarint(data, pos):
+    # (value, next position)
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+class ASTWriter:
+    def __init__(self):
+        """
+        Encodes an AST. The strings are written once, in a table, and a node, list or dict that is
+        referenced more than once (a block in the scopes of a method and in its body, the case blocks of a
+        switch, ...) is written once and then referenced by its index, so the identities are kept.
+        """
+        self.strings = {}
+        self.memo = {}
+        self.nodeTypes = {cls: i for i, cls in enumerate(NODE_CLASSES)}
+        self.enumTypes = {enum: i for i, enum in enumerate(ENUMS)}
+
+    def string(self, s):
+        index = self.strings.get(s)
+        if index is None:
+            index = self.strings[s] = len(self.strings)
+        return index
+
+    def encodeValue(self, root):
+        # the body, with an explicit stack: the expressions of long concatenations are deeply nested
+        out = bytearray()
+        stack = [root]
+        while stack:
+            value = stack.pop()
+            valueType = type(value)
+            if value is None:
+                out.append(NONE)
+            elif valueType is bool:
+                out.append(TRUE if value else FALSE)
+            elif valueType is Pos:
+                out.append(POS)
+                writeVarint(out, int(value))
+            elif valueType is int:
+                out.append(INT)
+                writeVarint(out, value << 1 if value >= 0 else (-value << 1) - 1)
+            elif valueType is str:
+                out.append(STR)
+                writeVarint(out, self.string(value))
+            elif valueType is float:
+                out.append(FLOAT)
+                out += FLOAT_FORMAT.pack(value)
+            elif valueType in self.enumTypes:
+                out.append(ENUM)
+                writeVarint(out, self.enumTypes[valueType])
+                writeVarint(out, self.string(value.name))
+            elif id(value) in self.memo:
+                out.append(REF)
+                writeVarint(out, self.memo[id(value)])
+            else:
+                # the value is kept alive by the AST, its id can't be reused while encoding
+                self.memo[id(value)] = len(self.memo)
+                if valueType is list:
+                    out.append(LIST)
+                    writeVarint(out, len(value))
+                    stack.extend(reversed(value))
+                elif valueType is dict:
+                    out.append(DICT)
+                    writeVarint(out, len(value))
+                    for key, item in reversed(value.items()):
+                        stack.append(item)
+                        stack.append(key)
+                elif valueType in self.nodeTypes:
+                    out.append(NODE)
+                    writeVarint(out, self.nodeTypes[valueType])
+                    stack.extend(getattr(value, name) for name in reversed(valueType.__slots__))
+                else:
+                    raise ValueError(f"can't serialize a {valueType.__name__} in an AST")
+        return out
+
+    def encode(self, ast):
+        body = self.encodeValue(ast)
+
+        schema = bytearray()
+        writeVarint(schema, len(NODE_CLASSES))
+        for cls in NODE_CLASSES:
+            writeVarint(schema, self.string(cls.__qualname__))
+            writeVarint(schema, len(cls.__slots__))
+            for name in cls.__slots__:
+                writeVarint(schema, self.string(name))
+        writeVarint(schema, len(ENUMS))
+        for enum in ENUMS:
+            writeVarint(schema, self.string(enum.__qualname__))
+
+        out = bytearray(MAGIC)
+        out += struct.pack("<H", VERSION)
+        writeVarint(out, len(self.strings))
+        for s in self.strings:
+            encoded = s.encode("utf8")
+            writeVarint(out, len(encoded))
+            out += encoded
+        out += schema
+        out += body
+        return bytes(out)
+
+
+class ASTReader:
+    def __init__(self, data):
+        """
+        Decodes an AST written by ASTWriter. The node classes and their attributes are looked up by
+        name: a file written before an attribute was added to a class loads with the attribute set
+        to None, a file with an unknown class or attribute is rejected.
+        """
+        self.data = data
+        self.pos = 0
+
+    def varint(self):
+        value, self.pos = readVarint(self.data, self.pos)
+        return value
+
+    def header(self):
+        if self.data[:len(MAGIC)] != MAGIC:
+            raise ValueError("not a serialized AST")
+        version, = struct.unpack_from("<H", self.data, len(MAGIC))
+        if version != VERSION:
+            raise ValueError(f"unsupported serialized AST version {version} (expected {VERSION})")
+        self.pos = len(MAGIC) + 2
+
+        self.strings = []
+        for _ in range(self.varint()):
+            length = self.varint()
+            self.strings.append(self.data[self.pos:self.pos + length].decode("utf8"))
+            self.pos += length
+
+        classes = {cls.__qualname__: cls for cls in NODE_CLASSES}
+        self.nodeTypes = []
+        for _ in range(self.varint()):
+            name = self.strings[self.varint()]
+            fields = [self.strings[self.varint()] for _ in range(self.varint())]
+            cls = classes.get(name)
+            if cls is None or not set(fields) <= set(cls.__slots__):
+                raise ValueError(f"unsupported AST node {name}({', '.join(fields)})")
+            missing = [f for f in cls.__slots__ if f not in fields]
+            self.nodeTypes.append((cls, fields, missing))
+
+        enums = {enum.__qualname__: enum for enum in ENUMS}
+        self.enumTypes = []
+        for _ in range(self.varint()):
+            name = self.strings[self.varint()]
+            if name not in enums:
+                raise ValueError(f"unsupported AST enum {name}")
+            self.enumTypes.append(enums[name])
+
+    def decode(self):
+        self.header()
+        data = self.data
+        strings = self.strings
+        memo = []
+
+        # the containers being filled: [container, number of values, values so far, node attributes or dict key]
+        root = []
+        stack = [[root, 1, 0, None]]
+        while stack:
+            frame = stack[-1]
+            if frame[2] == frame[1]:
+                stack.pop()
+                continue
+
+            tag = data[self.pos]
+            self.pos += 1
+            child = None
+            if tag == NONE:
+                value = None
+            elif tag == STR:
+                value = strings[self.varint()]
+            elif tag == POS:
+                packed = self.varint()
+                value = Pos(packed >> 32, packed & 0xFFFFFFFF)
+            elif tag == INT:
+                n = self.varint()
+                value = n >> 1 if not n & 1 else -((n + 1) >> 1)
+            elif tag == TRUE or tag == FALSE:
+                value = tag == TRUE
+            elif tag == FLOAT:
+                value, = FLOAT_FORMAT.unpack_from(data, self.pos)
+                self.pos += FLOAT_FORMAT.size
+            elif tag == ENUM:
+                enum = self.enumTypes[self.varint()]
+                value = enum[strings[self.varint()]]
+            elif tag == REF:
+                value = memo[self.varint()]
+            elif tag == LIST:
+                value = []
+                child = [value, self.varint(), 0, None]
+            elif tag == DICT:
+                value = {}
+                child = [value, 2 * self.varint(), 0, None]
+            elif tag == NODE:
+                cls, fields, missing = self.nodeTypes[self.varint()]
+                value = cls.__new__(cls)
+                for name in missing:
+                    setattr(value, name, None)
+                child = [value, len(fields), 0, fields]
+            else:
+                raise ValueError(f"corrupt serialized AST (tag {tag} at {self.pos - 1})")
+
+            if child is not None:
+                memo.append(value)
+
+            # store the value in the container of the frame
+            container = frame[0]
+            if type(container) is list:
+                container.append(value)
+            elif type(container) is dict:
+                if frame[2] % 2 == 0:
+                    frame[3] = value
+                else:
+                    container[frame[3]] = value
+            else:
+                setattr(container, frame[3][frame[2]], value)
+            frame[2] += 1
+
+            if child is not None:
+                stack.append(child)
+
+        return root[0]
+
+
+def dumpAST(ast):
+    return ASTWriter().encode(ast)
+
+
+def loadAST(data):
+    try:
+        ast = ASTReader(data).decode()
+    except (IndexError, KeyError, struct.error, UnicodeDecodeError) as e:
+        raise ValueError(f"corrupt serialized AST ({e!r})") from e
+    if type(ast) is not AST:
+        raise ValueError("the serialized value is not an AST")
+    return ast
+
+
+def writeAST(ast, path):
+    # written atomically, like the entries of the result cache
+    data = dumpAST(ast)
+    fd, tmpPath = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as tmpFile:
+            tmpFile.write(data)
+        os.replace(tmpPath, path)
+    except OSError:
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+        raise
+
+
+def readAST(path):
+    with open(path, "rb") as f:
+        return loadAST(f.read())
+
+
+def isASTFile(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
@@ -0,0 +1,350 @@
+import os
+
+from antlr4 import CommonTokenStream, FileStream, Token
+
+from code.ast import AST, Class, Pos
+from code.cfg import OutputMode
+from code.listener import ASTListener
+from code.parser import getParserWorker
+from code.timing import getPhaseTimer
+from code.visitor import ASTVisitor
+from code.walker import IterativeParseTreeWalker
+from gen.Java20Lexer import Java20Lexer
+
+
+# the tokens of a member that make it a nested type declaration
+TYPE_KEYWORDS = {Java20Lexer.CLASS, Java20Lexer.INTERFACE, Java20Lexer.ENUM, Java20Lexer.RECORD}
+
+
+class Member:
+    __slots__ = ("classIndex", "className", "start", "stop", "line", "column")
+
+    def __init__(self, classIndex, className, start, stop, line, column):
+        """
+        A method or a constructor of a top level class: the characters start..stop (inclusive)
+        of the file, which begin at line:column.
+        """
+        self.classIndex = classIndex
+        self.className = className
+        self.start = start
+        self.stop = stop
+        self.line = line
+        self.column = column
+
+
+def matchingBrace(tokens, i):
+    # index of the '}' closing the '{' at tokens[i]
+    depth = 0
+    for j in range(i, len(tokens)):
+        if tokens[j].type == Java20Lexer.LBRACE:
+            depth += 1
+        elif tokens[j].type == Java20Lexer.RBRACE:
+            depth -= 1
+            if depth == 0:
+                return j
+    return None
+
+
+def skipAnnotation(tokens, i):
+    # index of the token after the annotation at tokens[i] ('@'), or None for an annotation type declaration
+    i += 1
+    if tokens[i].type == Java20Lexer.INTERFACE:
+        return None
+    i += 1
+    while tokens[i].type == Java20Lexer.DOT:
+        i += 2
+    if tokens[i].type == Java20Lexer.LPAREN:
+        parens = 0
+        while True:
+            if tokens[i].type == Java20Lexer.LPAREN:
+                parens += 1
+            elif tokens[i].type == Java20Lexer.RPAREN:
+                parens -= 1
+                if parens == 0:
+                    return i + 1
+            elif tokens[i].type == Token.EOF:
+                return None
+            i += 1
+    return i
+
+
+def isTypeDeclaration(tokens, i):
+    # 'class' of a class literal (String.class) doesn't declare a type
+    return tokens[i].type in TYPE_KEYWORDS and not (i > 0 and tokens[i - 1].type == Java20Lexer.DOT)
+
+
+def findMembers(tokens):
+    # finds the methods and constructors of the top level classes by brace matching over the
+    # default channel tokens. returns (number of classes, members), or None if the file has
+    # something else than top level classes with fields, methods, constructors and initializers
+    # (interfaces, enums, records, nested types, ...): these files are parsed as a whole.
+    members = []
+    classes = 0
+    className = None
+    i = 0
+
+    while tokens[i].type != Token.EOF:
+        # top level: package, imports, annotations and class headers
+        token = tokens[i]
+        if token.type == Java20Lexer.AT:
+            i = skipAnnotation(tokens, i)
+            if i is None:
+                return None
+            continue
+        if isTypeDeclaration(tokens, i):
+            if token.type != Java20Lexer.CLASS or className is not None:
+                return None
+            className = tokens[i + 1].text
+        elif token.type == Java20Lexer.RBRACE or (token.type == Java20Lexer.LBRACE and className is None):
+            return None
+        if token.type != Java20Lexer.LBRACE:
+            i += 1
+            continue
+
+        # the body of a top level class
+        classIndex = classes
+        classes += 1
+
+        i += 1
+        memberStart = i
+        parens = 0
+        sawParen = False
+        sawAssign = False
+        while True:
+            token = tokens[i]
+            if token.type == Token.EOF:
+                return None
+
+            if token.type == Java20Lexer.RBRACE and parens == 0:
+                # end of the class body
+                if i != memberStart:
+                    return None
+                i += 1
+                className = None
+                break
+
+            if token.type == Java20Lexer.AT:
+                i = skipAnnotation(tokens, i)
+                if i is None:
+                    return None
+                continue
+            elif token.type == Java20Lexer.LPAREN:
+                parens += 1
+                sawParen = True
+            elif token.type == Java20Lexer.RPAREN:
+                parens -= 1
+            elif token.type == Java20Lexer.ASSIGN and parens == 0:
+                sawAssign = True
+            elif isTypeDeclaration(tokens, i):
+                return None
+
+            if token.type == Java20Lexer.SEMI and parens == 0:
+                if sawParen and not sawAssign:
+                    # an abstract or native method
+                    members.append(memberOf(tokens, classIndex, className, memberStart, i))
+                i += 1
+                memberStart = i
+                sawParen = sawAssign = False
+                continue
+
+            if token.type == Java20Lexer.LBRACE:
+                close = matchingBrace(tokens, i)
+                if close is None:
+                    return None
+                if parens != 0 or sawAssign:
+                    # an array initializer, a lambda or an anonymous class in a field initializer,
+                    # the member goes on to its ';'
+                    i = close + 1
+                    continue
+                if sawParen:
+                    members.append(memberOf(tokens, classIndex, className, memberStart, close))
+                # else an initializer block
+                i = close + 1
+                memberStart = i
+                sawParen = sawAssign = False
+                continue
+
+            i += 1
+
+    return classes, members
+
+
+def memberOf(tokens, classIndex, className, first, last):
+    return Member(classIndex, className, tokens[first].start, tokens[last].stop,
+                  tokens[first].line, tokens[first].column)
+
+
+def blankOut(text, members):
+    # the text with the characters of the members replaced by spaces (line breaks are kept),
+    # the rest of the file keeps its positions
+    parts = []
+    previous = 0
+    for m in members:
+        parts.append(text[previous:m.start])
+        parts.append("".join(c if c in "\r\n" else " " for c in text[m.start:m.stop + 1]))
+        previous = m.stop + 1
+    parts.append(text[previous:])
+    return "".join(parts)
+
+
+class SkeletonListener(ASTListener):
+    # the CFGs are generated once the methods are stitched into the AST of the skeleton
+    def exitCompilationUnit(self, ctx):
+        pass
+
+
+def buildAST(listener, parseTree, builder):
+    if builder == "visitor":
+        ASTVisitor(listener).visit(parseTree)
+    else:
+        IterativeParseTreeWalker().walk(listener, parseTree)
+
+
+def parseMember(worker, className, text, line, column, builder="listener"):
+    # parses a member (as a classBodyDeclaration) and builds its AST. returns (method, pop failures),
+    # or None if the member is not a plain method (a nested or anonymous class, a statement stack that is
+    # not empty at the end, a syntax error, ...).
+    try:
+        parseTree = worker.parseText(text, line, column, rule="classBodyDeclaration")
+        if not worker.atEnd():
+            return None
+        listener = SkeletonListener(os.devnull, OutputMode.NONE)
+        currentClass = Class(Pos(line, column), className)
+        listener.state.CurrentClass = currentClass
+        with getPhaseTimer().phase("walk"):
+            buildAST(listener, parseTree, builder)
+    except Exception:
+        return None
+
+    state = listener.state
+    if (len(listener.ast.decls) != 1 or state.StmtStack or state.CurrentClass is not currentClass
+            or currentClass.fields or state.CurrentMethod is not None):
+        return None
+    return listener.ast.decls[0], state.PopFailures
+
+
+def parseMemberBatch(texts, twoStage=False, builder="listener"):
+    # runs in a worker process: the results of parseMember for the members [(class name, text, line, column)],
+    # and the phase times of the worker for the batch
+    worker = getParserWorker(twoStage)
+    timer = getPhaseTimer()
+    timer.reset()
+    results = [parseMember(worker, *member, builder=builder) for member in texts]
+    return results, timer.asDict()
+
+
+def batches(members, count):
+    # contiguous batches of members of about the same size (in characters)
+    total = sum(m.stop - m.start + 1 for m in members)
+    target = max(1, total // max(1, count))
+    batch = []
+    size = 0
+    for m in members:
+        batch.append(m)
+        size += m.stop - m.start + 1
+        if size >= target:
+            yield batch
+            batch = []
+            size = 0
+    if batch:
+        yield batch
+
+
+class MethodSplitter:
+    def __init__(self, twoStage=False, builder="listener", executor=None, workers=1):
+        """
+        Builds the AST of a java file by parsing its methods independently, in the processes of
+        executor (or in this process without one).
+
+        A lexer pre-pass finds the methods and constructors of the top level classes by brace
+        matching. The rest of the file (the skeleton: package, classes, fields) is parsed here
+        with the methods blanked out, so every token keeps its position, and each method is
+        parsed from the classBodyDeclaration rule with the line and column it has in the file.
+        The ASTs of the methods are then stitched into the AST of the skeleton in source order,
+        which is the order the AST listener would have built them in. Files the pre-pass doesn't
+        understand, and files with a method that is not a plain method (a nested or anonymous
+        class, ...), return None: they are parsed as a whole.
+        """
+        self.twoStage = twoStage
+        self.builder = builder
+        self.executor = executor
+        self.workers = workers
+        self.popFailures = 0
+
+    def split(self, javaFilePath):
+        # (text, number of classes, members) of the file, or None
+        inputStream = FileStream(javaFilePath, encoding="utf8")
+        with getPhaseTimer().phase("split"):
+            lexer = Java20Lexer(inputStream)
+            tokenStream = CommonTokenStream(lexer)
+            tokenStream.fill()
+            tokens = [t for t in tokenStream.tokens if t.channel == Token.DEFAULT_CHANNEL]
+            found = findMembers(tokens)
+        if found is None:
+            return None
+        classes, members = found
+        return str(inputStream), classes, members
+
+    def parseMembers(self, members):
+        texts = [(m.className, self.text[m.start:m.stop + 1], m.line, m.column) for m in members]
+        if self.executor is None:
+            worker = getParserWorker(self.twoStage)
+            return [parseMember(worker, *member, builder=self.builder) for member in texts]
+
+        futures = []
+        start = 0
+        for batch in batches(members, self.workers * 4):
+            futures.append(self.executor.submit(parseMemberBatch, texts[start:start + len(batch)], self.twoStage,
+                                                self.builder))
+            start += len(batch)
+
+        results = []
+        timer = getPhaseTimer()
+        for future in futures:
+            batchResults, phases = future.result()
+            # the phases of the workers overlap the ones of this process
+            for name, phase in phases.items():
+                timer.add(name, phase["seconds"], phase["calls"])
+            results.extend(batchResults)
+        return results
+
+    def buildAST(self, javaFilePath):
+        found = self.split(javaFilePath)
+        if found is None:
+            return None
+        self.text, classes, members = found
+
+        results = self.parseMembers(members)
+        if any(r is None for r in results):
+            return None
+
+        skeleton = SkeletonListener(os.devnull, OutputMode.NONE)
+        try:
+            parseTree = getParserWorker(self.twoStage).parseText(blankOut(self.text, members))
+            with getPhaseTimer().phase("walk"):
+                buildAST(skeleton, parseTree, self.builder)
+        except Exception:
+            return None
+        if len(skeleton.ast.decls) != classes or not all(type(d) == Class for d in skeleton.ast.decls):
+            return None
+
+        return self.stitch(skeleton, members, results)
+
+    def stitch(self, skeleton, members, results):
+        ast = AST()
+        ast.package = skeleton.ast.package
+        # the methods keep their scopes, the skeleton has the others (classes, initializer blocks)
+        ast.scopes = skeleton.ast.scopes
+        self.popFailures = skeleton.state.PopFailures
+
+        # the listener adds a method to the declarations when it leaves the method, and a class
+        # when it leaves the class: the methods of a class come before it.
+        k = 0
+        for classIndex, c in enumerate(skeleton.ast.decls):
+            while k < len(members) and members[k].classIndex == classIndex:
+                ast.decls.append(results[k][0])
+                self.popFailures += results[k][1]
+                k += 1
+            ast.decls.append(c)
+
+        return ast
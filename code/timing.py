@@ -0,0 +1,130 @@
+import csv
+import json
+import threading
+import time
+
+
+# the phases of main.run, in pipeline order
+PHASES = ["split", "lex", "parse", "walk", "cfg", "prepareFinalCFG", "dumpJson", "drawCFG", "render"]
+
+
+class Phase:
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.timer.start(self.name)
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.timer.stop()
+        return False
+
+
+class PhaseTimer:
+    def __init__(self):
+        """
+        Accumulates the wall time and the number of calls of each phase of the pipeline.
+
+        Phases are exclusive: when a phase starts inside another one of the same thread (CFG generation
+        runs inside the tree walk), the outer phase is paused, so the phases of a file add up to its processing time.
+        add() is used by the render threads, whose `dot` time runs in the background and overlaps the other phases.
+        """
+        self.lock = threading.Lock()
+        self.phases = {}
+        # every thread has its own stack of running phases
+        self.local = threading.local()
+
+    def phase(self, name):
+        return Phase(self, name)
+
+    def stack(self):
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    def start(self, name):
+        now = time.perf_counter()
+        stack = self.stack()
+        if stack:
+            outer, outerStart = stack[-1]
+            self.add(outer, now - outerStart, calls=0)
+        stack.append((name, now))
+
+    def stop(self):
+        now = time.perf_counter()
+        stack = self.stack()
+        name, start = stack.pop()
+        self.add(name, now - start)
+        if stack:
+            stack[-1] = (stack[-1][0], now)
+
+    def add(self, name, seconds, calls=1):
+        with self.lock:
+            phase = self.phases.setdefault(name, [0.0, 0])
+            phase[0] += seconds
+            phase[1] += calls
+
+    def reset(self):
+        with self.lock:
+            self.phases = {}
+        self.local = threading.local()
+
+    def asDict(self):
+        # {phase: {"seconds": ..., "calls": ...}}, in pipeline order
+        with self.lock:
+            names = [p for p in PHASES if p in self.phases] + [p for p in self.phases if p not in PHASES]
+            return {p: {"seconds": self.phases[p][0], "calls": self.phases[p][1]} for p in names}
+
+
+# one phase timer per process, see getPhaseTimer()
+phaseTimer = None
+
+
+def getPhaseTimer():
+    global phaseTimer
+    if phaseTimer is None:
+        phaseTimer = PhaseTimer()
+    return phaseTimer
+
+
+def totalPhases(filePhases):
+    # sums the per file phase dicts of a run
+    total = {}
+    for phases in filePhases:
+        for name, phase in phases.items():
+            t = total.setdefault(name, {"seconds": 0.0, "calls": 0})
+            t["seconds"] += phase["seconds"]
+            t["calls"] += phase["calls"]
+    return total
+
+
+def writeTimingReport(path, files, elapsed=None):
+    # files: [{"file": ..., "elapsed": ..., "phases": {...}}]
+    # the report is json, or csv (one row per file and a "total" row) if path ends with .csv
+    total = totalPhases(f["phases"] for f in files)
+
+    if str(path).endswith(".csv"):
+        names = [p for p in PHASES if p in total] + [p for p in total if p not in PHASES]
+        with open(path, "w", newline="") as csvFile:
+            writer = csv.writer(csvFile)
+            writer.writerow(["file", "elapsed"] + names)
+            for f in files:
+                writer.writerow([f["file"], f"{f['elapsed']:.6f}"] +
+                                [f"{f['phases'].get(p, {'seconds': 0.0})['seconds']:.6f}" for p in names])
+            writer.writerow(["total", f"{elapsed if elapsed is not None else sum(f['elapsed'] for f in files):.6f}"] +
+                            [f"{total[p]['seconds']:.6f}" for p in names])
+        return
+
+    report = {
+        "files": files,
+        "total": {
+            "files": len(files),
+            "elapsed": elapsed if elapsed is not None else sum(f["elapsed"] for f in files),
+            "phases": total,
+        },
+    }
+    with open(path, "w") as jsonFile:
+        json.dump(report, jsonFile, indent=4)
@@ -0,0 +1,72 @@
+from antlr4.tree.Tree import TerminalNode
+
+from code.listener import ASTListener
+from gen.Java20Parser import Java20Parser
+from gen.Java20ParserVisitor import Java20ParserVisitor
+
+
+def listenerContexts(listenerClass):
+    # the context classes that have an enter or exit method in listenerClass (enterBlock -> BlockContext, ...)
+    contexts = set()
+    for name in vars(listenerClass):
+        for prefix in ("enter", "exit"):
+            if name.startswith(prefix):
+                context = getattr(Java20Parser, name[len(prefix):] + "Context", None)
+                if context is not None:
+                    contexts.add(context)
+    return contexts
+
+
+# the contexts the AST listener handles
+HANDLED_CONTEXTS = frozenset(listenerContexts(ASTListener))
+
+# the contexts whose subtrees only hold expressions, types or labels. the listener handles nothing in
+# them, unless they contain a block or a class body (a lambda body, an anonymous class or a switch
+# expression), which can't be there without a '{' in their source text.
+SKIPPED_CONTEXTS = frozenset([
+    Java20Parser.ExpressionContext,
+    Java20Parser.StatementExpressionContext,
+    Java20Parser.UnannTypeContext,
+    Java20Parser.LocalVariableTypeContext,
+    Java20Parser.ResultContext,
+    Java20Parser.SwitchLabelContext,
+])
+
+
+def mayContainBlock(ctx):
+    start, stop = ctx.start, ctx.stop
+    if start is None or stop is None or stop.stop < start.start:
+        return True
+    # '{' in a string literal or a comment only makes the check fail safe
+    return "{" in start.getInputStream().getText(start.start, stop.stop)
+
+
+class ASTVisitor(Java20ParserVisitor):
+    def __init__(self, listener):
+        """
+        Builds the AST of a parse tree with the handlers of an ASTListener, like ParseTreeWalker does,
+        but visits only the subtrees where the listener has something to do.
+
+        ParseTreeWalker sends an enter and an exit event for every context of the tree, most of them
+        in expressions (a single literal is about twenty nested contexts deep) that the listener
+        builds in one go (see ParseExpressionSubTree) when it enters their statement. This visitor
+        calls the listener only for the contexts it handles, and skips the subtrees of
+        SKIPPED_CONTEXTS that can't contain a statement.
+        """
+        self.listener = listener
+
+    def visitChildren(self, ctx):
+        contextType = type(ctx)
+        if contextType in SKIPPED_CONTEXTS and not mayContainBlock(ctx):
+            return None
+
+        handled = contextType in HANDLED_CONTEXTS
+        if handled:
+            ctx.enterRule(self.listener)
+        if ctx.children is not None:
+            for child in ctx.children:
+                if not isinstance(child, TerminalNode):
+                    child.accept(self)
+        if handled:
+            ctx.exitRule(self.listener)
+        return None
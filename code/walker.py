@@ -0,0 +1,41 @@
+from antlr4 import ParseTreeWalker
+from antlr4.tree.Tree import ErrorNode, TerminalNode
+
+
+class IterativeParseTreeWalker(ParseTreeWalker):
+    def __init__(self):
+        """
+        A ParseTreeWalker that sends the same events in the same order, but keeps the contexts
+        being walked on an explicit stack instead of recursing: the parse tree of a long
+        left-nested expression (like a string concatenation of a thousand terms) is deeper
+        than the recursion limit of python.
+        """
+        super().__init__()
+
+    def walk(self, listener, t):
+        if isinstance(t, ErrorNode):
+            listener.visitErrorNode(t)
+            return
+        elif isinstance(t, TerminalNode):
+            listener.visitTerminal(t)
+            return
+
+        # enterRule/exitRule of ParseTreeWalker are inlined, they are called for every context
+        listener.enterEveryRule(t)
+        t.enterRule(listener)
+        stack = [(t, iter(t.children or ()))]
+        while stack:
+            ctx, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+                ctx.exitRule(listener)
+                listener.exitEveryRule(ctx)
+            elif isinstance(child, ErrorNode):
+                listener.visitErrorNode(child)
+            elif isinstance(child, TerminalNode):
+                listener.visitTerminal(child)
+            else:
+                listener.enterEveryRule(child)
+                child.enterRule(listener)
+                stack.append((child, iter(child.children or ())))
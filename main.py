@@ -1,71 +1,351 @@
+import argparse
 import os
 import shutil
 import sys
 import time
 import multiprocessing as mp
-from concurrent.futures.thread import ThreadPoolExecutor
+from multiprocessing.util import Finalize
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from pathlib import Path
 
-from antlr4 import CommonTokenStream, FileStream, ParseTreeWalker
+try:
+    import resource
+except ImportError:  # not available on windows
+    resource = None
 
-from code.listener import ASTListener, MyErrorListener
-from gen.Java20Lexer import Java20Lexer
-from gen.Java20Parser import Java20Parser
+# the generated parser (and everything that imports it: the listener, the parser worker, the visitor, the
+# splitter) is imported by the functions that parse: deserializing its ATN is most of the startup time,
+# which --help, a run from a saved AST or a run restored from the cache don't need.
+from code.cache import ResultCache, getResultCache
+from code.cfg import OutputMode, SourceLevelCFG
+from code.incremental import manifestFiles
+from code.pool import defaultStartMethod, poolContext, timestamp
+from code.render import closeRenderQueue, configureRenderQueue, getRenderQueue
+from code.serialize import AST_FILE_NAME, isASTFile, readAST, writeAST
+from code.timing import getPhaseTimer, writeTimingReport
 
 
-def run(javaFilePath,output_dir):
-    tokenStream = FileStream(javaFilePath, encoding="utf8")
-    lexer = Java20Lexer(tokenStream)
-    token_stream = CommonTokenStream(lexer)
-    parser = Java20Parser(token_stream)
-    parser.removeErrorListeners()
-    parser.addErrorListener(MyErrorListener())
+def run(javaFilePath,output_dir, twoStage=False, outputMode=OutputMode.PDF, incremental=False, stream=None,
+        builder="listener", splitter=None, saveAst=False):
+    # twoStage: parse with SLL prediction first and fall back to full LL only on failure
+    # outputMode: what is written for every method (json, dot text, pdf/svg, or nothing)
+    # incremental: keep the outputs of the methods that didn't change since the last run
+    # stream: generate the CFG of each method as soon as it is walked ("inline"), or in a background thread ("thread")
+    # builder: build the AST with ParseTreeWalker and ASTListener ("listener"), or with ASTVisitor ("visitor"),
+    # which calls the same handlers but skips the subtrees they have nothing to do in
+    # splitter: a MethodSplitter that parses the methods of the file independently (see code/splitter.py),
+    # the file is parsed as a whole if the splitter can't split it
+    # saveAst: also write the AST to output_dir/ast.bin (see code/serialize.py), not with stream
+    # (the method bodies are released as soon as their CFG is written)
+    # returns the number of statements the AST builder couldn't place (see WalkerState.PopFailures)
+    # the lexer/parser of the process are reused, so the ANTLR DFA cache stays warm between files.
+    from code.listener import ASTListener
+    from code.parser import getParserWorker
+    from code.visitor import ASTVisitor
+    from code.walker import IterativeParseTreeWalker
 
-    parseTree = parser.compilationUnit()
-    astListener = ASTListener(output_dir)
-    walker = ParseTreeWalker()
-    walker.walk(astListener, parseTree)
+    if splitter is not None:
+        ast = splitter.buildAST(javaFilePath)
+        if ast is not None:
+            if saveAst:
+                writeAST(ast, os.path.join(output_dir, AST_FILE_NAME))
+            SourceLevelCFG(ast, output_dir, outputMode, incremental).Gen()
+            return splitter.popFailures
+
+    parseTree = getParserWorker(twoStage).parse(javaFilePath)
+    astListener = ASTListener(output_dir, outputMode, incremental, stream)
+    with getPhaseTimer().phase("walk"):
+        try:
+            if builder == "visitor":
+                ASTVisitor(astListener).visit(parseTree)
+            else:
+                IterativeParseTreeWalker().walk(astListener, parseTree)
+        except Exception:
+            astListener.abort()
+            raise
+    if saveAst:
+        writeAST(astListener.ast, os.path.join(output_dir, AST_FILE_NAME))
+    return astListener.state.PopFailures
+
+
+def run_ast(astFilePath, output_dir, outputMode=OutputMode.PDF, incremental=False):
+    # generates the CFGs of an AST saved with saveAst, without parsing the java file again
+    ast = readAST(astFilePath)
+    SourceLevelCFG(ast, output_dir, outputMode, incremental).Gen()
 
 # for a directory (project)
-def process_file(file_path, dest_subdir):
+def output_files(dest_subdir):
+    # {name: (mtime, size)} of the generated files of an output directory
+    return {entry.name: (entry.stat().st_mtime_ns, entry.stat().st_size) for entry in os.scandir(dest_subdir)
+            if entry.is_file() and entry.name != "source.java"}
+
+def wait_for_renders(output_mode):
+    # waits for the graphs of the file in the render queue of this process: a failed render fails the file
+    if output_mode in (OutputMode.PDF, OutputMode.SVG):
+        errors = getRenderQueue().join()
+        if errors:
+            raise Exception("render failed: " + "; ".join(errors))
+
+def run_cached(file_path, dest_subdir, run_options, cache_options):
+    # restores the outputs of an unchanged file from the cache, or runs it and stores its outputs.
+    # returns the pop failures of the run, 0 on a cache hit (the file is not parsed).
+    cache = getResultCache(**cache_options)
+    output_mode = run_options.get("outputMode", OutputMode.PDF)
+    with open(file_path, "rb") as f:
+        key = cache.key(f.read(), output_mode.value + (":ast" if run_options.get("saveAst") else ""))
+
+    if cache.restore(key, dest_subdir):
+        return 0
+
+    before = output_files(dest_subdir)
+    pop_failures = run(file_path, dest_subdir, **run_options)
+
+    # the rendered graphs are part of the entry: wait for them (an entry with failed renders is not stored)
+    wait_for_renders(output_mode)
+
+    produced = [name for name, stat in output_files(dest_subdir).items() if before.get(name) != stat]
+    if run_options.get("incremental"):
+        # the outputs of the unchanged methods were kept, not written again: the entry holds every
+        # output of the manifest, so that it restores the whole output set into an empty directory
+        produced = sorted(set(produced) | set(manifestFiles(dest_subdir)))
+    cache.store(key, dest_subdir, produced)
+    return pop_failures
+
+def process_file(file_path, dest_subdir, run_options=None, cache_options=None):
+    # runs inside a worker process: the source is copied, parsed and its CFGs are written
+    # by the worker itself, only a small status record travels back to the parent.
+    start = time.perf_counter()
+    timer = getPhaseTimer()
+    timer.reset()
+    cache_counts = None
+    pop_failures = 0
     try:
-        run(file_path, dest_subdir)
-        print(f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time()))} File processed: '{Path(file_path).name}'")
+        os.makedirs(dest_subdir, exist_ok=True)
+        shutil.copy(file_path, os.path.join(dest_subdir, "source.java"))
+        if cache_options is not None:
+            cache = getResultCache(**cache_options)
+            before = cache.counts()
+            pop_failures = run_cached(file_path, dest_subdir, run_options or {}, cache_options)
+            cache_counts = {k: v - before[k] for k, v in cache.counts().items()}
+        else:
+            pop_failures = run(file_path, dest_subdir, **(run_options or {}))
+            wait_for_renders((run_options or {}).get("outputMode", OutputMode.PDF))
+        status = {"file": str(file_path), "ok": True, "error": ""}
     except Exception as e:
-        print(f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time()))} error: {e} file: '{Path(file_path).name}' skipping...")
+        status = {"file": str(file_path), "ok": False, "error": str(e)}
+
+    # hits, misses, bytes read and written by the result cache for this file
+    status["cache"] = cache_counts
+    # the statements of the file the AST builder couldn't place (they are not in its CFGs)
+    status["pop_failures"] = pop_failures
+
+    status["elapsed"] = time.perf_counter() - start
+    # render is the `dot` time of this worker's render threads during the file (background)
+    status["phases"] = timer.asDict()
+    # peak resident set size of the worker so far, in KiB on Linux
+    status["max_rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource is not None else 0
+    status["dfa_states"] = dfa_state_count()
+    return status
+
+def dfa_state_count():
+    # the DFA states of the parser worker of this process, 0 if it parsed nothing (every file restored from the cache)
+    from code.parser import parserWorker
+    return sum(parserWorker.dfaStateCount().values()) if parserWorker is not None else 0
 
-def generate_directory_cfg(source_dir, destination_dir):
+def warm_up(run_options, warm_up_dir):
+    from code.parser import getParserWorker
+
+    worker = getParserWorker((run_options or {}).get("twoStage", False))
+    if warm_up_dir is not None and not worker.warmedUp:
+        worker.warmUp(warm_up_dir)
+
+def init_worker(run_options, warm_up_dir, render_options):
+    # runs once per worker process, before its first file
+    configureRenderQueue(**(render_options or {}))
+    # the graphs still waiting in the render queue are flushed when the worker exits,
+    # which the pool waits for at the end of the batch run.
+    Finalize(None, closeRenderQueue, exitpriority=10)
+    warm_up(run_options, warm_up_dir)
+
+def report_status(status):
+    if status["ok"] and status.get("cache") and status["cache"]["hits"]:
+        print(f"{timestamp()} File restored from cache: '{Path(status['file']).name}'")
+    elif status["ok"]:
+        print(f"{timestamp()} File processed: '{Path(status['file']).name}'")
+    else:
+        print(f"{timestamp()} error: {status['error']} file: '{Path(status['file']).name}' skipping...")
+
+def iter_java_files(source_dir, destination_dir):
     source_path = Path(source_dir)
     dest_path = Path(destination_dir)
 
-    # Use a context object for multiprocessing operations
-    ctx = mp.get_context("spawn")
+    for root, dirs, files in os.walk(source_dir):
+        for file in files:
+            if file.endswith('.java'):
+                file_path = Path(root) / file
+                rel_path = file_path.relative_to(source_path)
+                yield file_path, dest_path / rel_path.parent / file
+
+def generate_directory_cfg(source_dir, destination_dir, workers=None, start_method=None, max_in_flight=None,
+                           run_options=None, warm_up_dir=None, render_options=None, cache_options=None):
+    workers = workers or os.cpu_count() or 1
+    # bound the number of submitted but unfinished files, so huge corpora don't queue
+    # every path in the executor at once.
+    max_in_flight = max_in_flight or workers * 4
+    start_method = start_method or defaultStartMethod()
+    ctx = poolContext(start_method)
+
+    # with fork, warm the parser up once in the parent: every worker inherits the warm DFA.
+    if start_method == "fork":
+        warm_up(run_options, warm_up_dir)
+
+    statuses = []
+    pending = set()
 
-    # Create a ThreadPoolExecutor using the custom context
-    with ThreadPoolExecutor(max_workers=mp.cpu_count(), initializer=lambda: ctx) as executor:
-        futures = []
-        for root, dirs, files in os.walk(source_dir):
-            for file in files:
-                if file.endswith('.java'):
-                    file_path = Path(root) / file
-                    rel_path = file_path.relative_to(source_path)
-                    dest_subdir = dest_path / rel_path.parent / file
-                    dest_subdir.mkdir(parents=True, exist_ok=True)
-                    shutil.copy(file_path, os.path.join(dest_subdir.absolute(), "source.java"))
+    def collect(done):
+        for future in done:
+            status = future.result()
+            report_status(status)
+            statuses.append(status)
 
-                    future = executor.submit(process_file, file_path, dest_subdir)
-                    futures.append(future)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=init_worker,
+                             initargs=(run_options, warm_up_dir, render_options)) as executor:
+        for file_path, dest_subdir in iter_java_files(source_dir, destination_dir):
+            pending.add(executor.submit(process_file, str(file_path), str(dest_subdir), run_options,
+                                         cache_options))
 
-        for future in futures:
-            future.result()
+            if len(pending) >= max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
 
+        done, pending = wait(pending)
+        collect(done)
 
-source_directory = "javasamples/SF110/"
-destination_directory = "output/SF110/"
+    # the size bound of the cache is enforced once per run, by the parent
+    if cache_options is not None:
+        ResultCache(**cache_options).evict()
 
-# generate_directory_cfg(source_directory, destination_directory)
+    return statuses
 
-# for one sample
-run("javasamples/Example1.java","output")
+
+def main(argv=None):
+    argParser = argparse.ArgumentParser(description="Generate source-level CFGs for a Java file or a directory (project).")
+    argParser.add_argument("source", nargs="?", default="javasamples/Example1.java",
+                           help="a .java file, a directory containing .java files, or an AST saved with --save-ast")
+    argParser.add_argument("-o", "--output", default="output", help="output directory")
+    argParser.add_argument("-j", "--workers", type=int, default=None,
+                           help="number of worker processes for a directory, or for the methods of a file with "
+                                "--split-methods (default: cpu count)")
+    argParser.add_argument("--start-method", choices=mp.get_all_start_methods(), default=None,
+                           help="multiprocessing start method (default: forkserver when available)")
+    argParser.add_argument("--max-in-flight", type=int, default=None,
+                           help="maximum number of files queued in the worker pool (default: 4 * workers)")
+    argParser.add_argument("--sll", action="store_true",
+                           help="parse with SLL prediction first, re-parse with full LL only if it fails")
+    argParser.add_argument("--warm-up", default=None, metavar="DIR",
+                           help="parse the .java files of DIR (e.g. javasamples/) in every worker before "
+                                "the real work to warm the parser DFA cache up")
+    argParser.add_argument("--render-workers", type=int, default=2,
+                           help="number of concurrent `dot` subprocesses per process (default: 2)")
+    argParser.add_argument("--render-queue-size", type=int, default=64,
+                           help="maximum number of graphs waiting to be rendered before CFG generation blocks "
+                                "(default: 64)")
+    argParser.add_argument("--output-mode", choices=[m.value for m in OutputMode], default=OutputMode.PDF.value,
+                           help="json: json only, dot: DOT text only, pdf/svg: json and rendered graph, "
+                                "none: build the CFGs without writing anything (default: pdf)")
+    argParser.add_argument("--incremental", action="store_true",
+                           help="fingerprint every method and only generate again the methods that changed since "
+                                "the last run into the same output directory")
+    argParser.add_argument("--stream", choices=["inline", "thread"], default=None,
+                           help="generate the CFG of every method as soon as the tree walker leaves it, instead of "
+                                "after the whole file (inline), or in a background thread (thread); the method "
+                                "bodies and their parse trees are released once their CFG is written")
+    argParser.add_argument("--builder", choices=["listener", "visitor"], default="listener",
+                           help="build the AST by walking the whole parse tree with the listener (listener), or by "
+                                "visiting only the statements and declarations (visitor, faster) (default: listener)")
+    argParser.add_argument("--split-methods", action="store_true",
+                           help="for a single file: parse the methods of the file independently, in -j worker "
+                                "processes, and stitch their ASTs together (for huge generated files); files with "
+                                "nested types, interfaces or enums are parsed as a whole")
+    argParser.add_argument("--save-ast", action="store_true",
+                           help=f"also write the AST of every file to {AST_FILE_NAME} in its output directory, in a "
+                                f"compact binary format; give such a file as the source to generate the CFGs again "
+                                f"without parsing (not with --stream)")
+    argParser.add_argument("--cache", default=None, metavar="DIR",
+                           help="directory of a persistent result cache: the outputs of a file whose contents "
+                                "(and tool version and output mode) didn't change since a previous run are copied "
+                                "from the cache instead of being generated again (directory runs only)")
+    argParser.add_argument("--cache-size", type=int, default=1024, metavar="MB",
+                           help="maximum size of the cache, the least recently used entries are evicted at the end "
+                                "of a run (default: 1024)")
+    argParser.add_argument("--timings", default=None, metavar="FILE",
+                           help="write the time spent in each phase (lex, parse, walk, cfg, prepareFinalCFG, "
+                                "dumpJson, drawCFG, render) per file and in total to FILE (.json or .csv)")
+    args = argParser.parse_args(argv)
+    if args.save_ast and args.stream:
+        argParser.error("--save-ast can't be used with --stream")
+    if args.cache and not os.path.isdir(args.source):
+        argParser.error("--cache is for directory runs only")
+
+    run_options = {"twoStage": args.sll, "outputMode": OutputMode(args.output_mode), "incremental": args.incremental,
+                   "stream": args.stream, "builder": args.builder, "saveAst": args.save_ast}
+    render_options = {"workers": args.render_workers, "maxPending": args.render_queue_size}
+    cache_options = None
+    if args.cache:
+        cache_options = {"directory": args.cache, "maxBytes": args.cache_size * 1024 * 1024}
+
+    if os.path.isdir(args.source):
+        start = time.perf_counter()
+        statuses = generate_directory_cfg(args.source, args.output, args.workers, args.start_method, args.max_in_flight,
+                                          run_options, args.warm_up, render_options, cache_options)
+        if cache_options is not None:
+            cache = ResultCache(**cache_options)
+            for s in statuses:
+                cache.addCounts(s["cache"])
+            stats = cache.stats()
+            print(f"{timestamp()} cache: {stats['hits']} hits, {stats['misses']} misses, "
+                  f"{stats['bytes_read']} bytes read, {stats['bytes_written']} bytes written, "
+                  f"{stats['entries']} entries ({stats['bytes']} bytes)")
+        if args.timings:
+            writeTimingReport(args.timings, [{"file": s["file"], "elapsed": s["elapsed"], "phases": s["phases"]}
+                                             for s in statuses], time.perf_counter() - start)
+        failed = sum(1 for s in statuses if not s["ok"])
+        dfa_states = max((s["dfa_states"] for s in statuses), default=0)
+        pop_failures = sum(s["pop_failures"] for s in statuses)
+        print(f"{timestamp()} {len(statuses) - failed} files processed, {failed} failed, "
+              f"{pop_failures} statements dropped, parser DFA states per worker: {dfa_states}")
+        return 1 if failed else 0
+
+    # for one sample
+    os.makedirs(args.output, exist_ok=True)
+    configureRenderQueue(**render_options)
+    start = time.perf_counter()
+    splitter = None
+    executor = None
+    if args.split_methods:
+        from code.splitter import MethodSplitter
+
+        workers = args.workers or os.cpu_count() or 1
+        if workers > 1:
+            executor = ProcessPoolExecutor(max_workers=workers,
+                                           mp_context=poolContext(args.start_method or defaultStartMethod()),
+                                           initializer=warm_up, initargs=(run_options, args.warm_up))
+        splitter = MethodSplitter(args.sll, args.builder, executor, workers)
+    try:
+        if isASTFile(args.source):
+            run_ast(args.source, args.output, run_options["outputMode"], run_options["incremental"])
+        else:
+            run(args.source, args.output, splitter=splitter, **run_options)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    # wait for the rendering of the last graphs
+    errors = closeRenderQueue()
+    if args.timings:
+        writeTimingReport(args.timings, [{"file": args.source, "elapsed": time.perf_counter() - start,
+                                          "phases": getPhaseTimer().asDict()}])
+    return 1 if errors else 0
 
 
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,24 @@
+import argparse
 import html
+import multiprocessing as mp
+import os
 import random
 import re
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
 
 import networkx as nx
-import graphviz as gv
+from antlr4 import InputStream, Token
 from code.ast import *
+from code.cfg import OutputMode
+from code.listener import ASTListener
+from code.parser import getParserWorker
+from code.pool import defaultStartMethod, poolContext, timestamp
+from code.splitter import matchingBrace
+from code.walker import IterativeParseTreeWalker
+from gen.Java20Lexer import Java20Lexer
 
 
 class BasicBlock:
@@ -45,9 +59,180 @@ class BasicBlock:
         return res
 
 
+# the bits of every byte in reverse order, to reverse the bits of the case keys a byte at a time
+BYTE_REVERSE = [int(f"{b:08b}"[::-1], 2) for b in range(256)]
+
+# the width of the case keys: the loop variable of the dispatcher is a positive java int
+DEFAULT_CASE_KEY_BITS = 16
+MAX_CASE_KEY_BITS = 31
+
+
+def reverseBits(value, bits):
+    # the bits low bits of value in reverse order (Integer.reverse(value) >>> (32 - bits) in java)
+    reversed32 = (BYTE_REVERSE[value & 0xFF] << 24 | BYTE_REVERSE[(value >> 8) & 0xFF] << 16 |
+                  BYTE_REVERSE[(value >> 16) & 0xFF] << 8 | BYTE_REVERSE[(value >> 24) & 0xFF])
+    return reversed32 >> (32 - bits)
+
+
+def genCaseKeys(rng, nodes, bits=DEFAULT_CASE_KEY_BITS):
+    # {node: [random number, case key]} for all the nodes at once: distinct nonzero case keys of the given width,
+    # and random numbers whose low bits are the reversed case keys (what getNextCase() of the dispatcher returns)
+    # with random high bits
+    if not 1 <= bits <= MAX_CASE_KEY_BITS:
+        raise ValueError(f"case keys must have 1 to {MAX_CASE_KEY_BITS} bits, not {bits}")
+    if len(nodes) >= 1 << bits:
+        raise ValueError(f"{len(nodes)} basic blocks don't fit in {bits} bit case keys")
+    keys = rng.sample(range(1, 1 << bits), len(nodes))
+    high = MAX_CASE_KEY_BITS - bits
+    return {node: [reverseBits(key, bits) | rng.getrandbits(high) << bits, key] for node, key in zip(nodes, keys)}
+
+
+# the statements constructSwitchCFG can flatten: it keeps the statements of the basic blocks as they are,
+# so a break or a continue would leave the dispatcher switch instead of its loop, and the branches of a
+# switch statement (or a labeled statement) are not dispatched.
+FLATTENED_STATEMENTS = (ExpressionStmt, DeclStmt, ReturnStmt, UnaryExpr, BinaryExpr, BlockStmt, BasicForStmt, IfStmt,
+                        WhileStmt, DoWhileStmt)
+
+# the operators of a BinaryExpr: the expression builder makes a BinaryExpr of any other context with 3 children,
+# so any other "operator" is a construct it doesn't model (new int[3] is new, int and [3]). the listener also builds
+# the element assignment of an enhanced for as a BinaryExpr with =.
+BINARY_OPERATORS = {"||", "&&", "|", "^", "&", "==", "!=", "<", ">", "<=", ">=", "instanceof", "<<", ">>", ">>>",
+                    "+", "-", "*", "/", "%", "="}
+
+
+def isModeled(expr):
+    # whether the AST models all of expr: the expression builder leaves None for an expression it can't
+    # build (like the array element on the left of arr[0] = 1), which would be printed as None
+    stack = [expr]
+    while stack:
+        expr = stack.pop()
+        if expr is None:
+            return False
+        if type(expr) == BinaryExpr:
+            if expr.op not in BINARY_OPERATORS:
+                return False
+            stack.extend((expr.lhs, expr.rhs))
+        elif type(expr) == AssignExpr:
+            stack.extend((expr.lhs, expr.rhs))
+        elif type(expr) in (UnaryExpr, CastExpr):
+            stack.append(expr.expr)
+        elif type(expr) == ConditionalExpr:
+            stack.extend((expr.cond, expr.trueExpr, expr.falseExpr))
+        elif type(expr) == MallocExpr:
+            # new int[3] { ... }: the dimensions are not modeled
+            if "[" in expr.name:
+                return False
+            stack.extend(expr.args)
+        elif type(expr) == CallExpr:
+            stack.extend(expr.args)
+    return True
+
+
+def isFlattenable(method):
+    # a method returning a value would miss a return statement after the dispatcher loop
+    if method.retType != "void" or method.bodyBlock is None or len(method.bodyBlock.body) == 0:
+        return False
+    if "getNextCase" in method.name:
+        return False
+    # a constructor (its body is not a block, so its body block keeps the position of the declaration),
+    # which may have to start with this() or super()
+    if method.bodyBlock.pos == method.pos:
+        return False
+
+    # the dispatcher loop only ends after the last statement of the method, so a return is only
+    # flattened as the last statement of the body
+    last = method.bodyBlock.body[-1]
+    stack = [method.bodyBlock]
+    while stack:
+        stmt = stack.pop()
+        if type(stmt) not in FLATTENED_STATEMENTS:
+            return False
+        if type(stmt) == ReturnStmt and stmt is not last:
+            return False
+        if type(stmt) == BlockStmt:
+            stack.extend(stmt.body)
+        elif type(stmt) == IfStmt:
+            stack.append(stmt.bodyBlock)
+            if stmt.elseBlock is not None:
+                stack.append(stmt.elseBlock)
+            if not isModeled(stmt.condExpr):
+                return False
+        elif type(stmt) == BasicForStmt:
+            stack.append(stmt.bodyBlock)
+            stack.extend(stmt.initStmtList)
+            stack.extend(stmt.updateStmtList)
+            if not isModeled(stmt.condExpr):
+                return False
+        elif type(stmt) in (WhileStmt, DoWhileStmt):
+            stack.append(stmt.bodyBlock)
+            if not isModeled(stmt.condExpr):
+                return False
+        elif type(stmt) == ExpressionStmt:
+            if not isModeled(stmt.expr):
+                return False
+        elif type(stmt) == DeclStmt:
+            if stmt.field.expr is not None and not isModeled(stmt.field.expr):
+                return False
+        elif type(stmt) in (UnaryExpr, BinaryExpr):
+            if not isModeled(stmt):
+                return False
+    return True
+
+
+def formatStmt(stmt, indent, lines):
+    # appends the java source lines of a statement of a flattened method to lines
+    pad = " " * indent
+    if type(stmt) == BlockStmt:
+        for s in stmt.body:
+            formatStmt(s, indent, lines)
+            # what follows a return in its block (the jump to the next case) is unreachable, javac rejects it
+            if type(s) == ReturnStmt:
+                break
+    elif type(stmt) == WhileStmt:
+        lines.append(f"{pad}while ({stmt.condExpr}) {{")
+        formatStmt(stmt.bodyBlock, indent + 4, lines)
+        lines.append(f"{pad}}}")
+    elif type(stmt) == SwitchStmt:
+        lines.append(f"{pad}switch ({stmt.expr}) {{")
+        for key, block in stmt.caseBlocks.items():
+            lines.append(f"{pad}    case {key}: {{")
+            formatStmt(block, indent + 8, lines)
+            lines.append(f"{pad}    }}")
+        lines.append(f"{pad}}}")
+    elif type(stmt) == IfStmt:
+        lines.append(f"{pad}if ({stmt.condExpr}) {{")
+        formatStmt(stmt.bodyBlock, indent + 4, lines)
+        if stmt.elseBlock is not None and len(stmt.elseBlock.body) != 0:
+            lines.append(f"{pad}}} else {{")
+            formatStmt(stmt.elseBlock, indent + 4, lines)
+        lines.append(f"{pad}}}")
+    else:
+        lines.append(f"{pad}{stmt};")
+
+
 class SourceLevelCFG:
-    def __init__(self, ast):
+    def __init__(self, ast, draw=True, caseKeyBits=DEFAULT_CASE_KEY_BITS, seed=None):
+        """
+        Flattens the control flow of the methods of an AST: the basic blocks of a method become the cases
+        of a switch in a dispatcher loop, and the next case is computed by getNextCase() of the dispatcher
+        class of the key width (see dispatcherClassName).
+
+        Gen() fills flattened with (method, java source of its new body) for every method isFlattenable
+        accepts. With draw, the CFG of every method is rendered before and after flattening.
+
+        The case keys have caseKeyBits bits (see genCaseKeys). With a seed, the case keys, the exit numbers
+        and the order of the cases only depend on the seed and the AST, so the output is reproducible.
+        """
         self.ast = ast
+        self.draw = draw
+        self.caseKeyBits = caseKeyBits
+        self.dispatcher = dispatcherClassName(caseKeyBits)
+        self.random = random.Random(seed)
+        self.flattened = []
+        self.reset()
+
+    def reset(self):
+        # a new graph for the next method
         self.CFG = nx.DiGraph()
         self.basicBlocks = {}
         self.bIndex = 0
@@ -67,9 +252,11 @@ class SourceLevelCFG:
             if type(d) == Class:
                 continue
             elif type(d) == Method:
-                if len(d.bodyBlock.body) == 0:
+                if not isFlattenable(d):
                     continue
 
+                self.reset()
+
                 lastBodyIndex = self.bIndex
                 lastGraphOpenNodes = [1]
 
@@ -125,10 +312,8 @@ class SourceLevelCFG:
 
                 self.prepareFinalCFG1()
 
-                self.drawCFG(d, "CFG")
-
-                if "getNextCase" in d.name:
-                    continue
+                if self.draw:
+                    self.drawCFG(d, "CFG")
 
                 # self.CFG = self.maxMerge(self.CFG)
 
@@ -142,43 +327,22 @@ class SourceLevelCFG:
 
                 whileStmt, nextCase = self.constructSwitchCFG(self.CFG)
 
-                self.genObfuscatedJavaFile(nextCase, whileStmt, d, declsList)
-
-                self.prepareFinalCFG2()
-
-                self.drawCFG(d, "OBFUSCATED_CFG")
-
-    def genObfuscatedJavaFile(self, nextCase, whileStmt, method, declsList):
-        res = """
-        package %PKG%;
-        
-        public class %CLSNAME% {
-        
-            public %ISSTATIC% void %MTHDNAME%(String[] args) {
-                %GLOBALDECLS%
-            
-                %nextCaseVar%;
-            
-                %WHILESTMT%
-            }
-        }
-        """
-        declsFinal = ""
-        for decl in declsList:
-            declsFinal += str(decl)
-            declsFinal += ";\n"
+                self.flattened.append((d, self.genObfuscatedBody(nextCase, whileStmt, declsList, d.pos.column)))
 
-        res = res.replace("%GLOBALDECLS%", declsFinal)
+                if self.draw:
+                    self.prepareFinalCFG2()
+                    self.drawCFG(d, "OBFUSCATED_CFG")
 
-        res = res.replace("%PKG%", self.ast.package)
-        res = res.replace("%CLSNAME%", method.scope)
-        res = res.replace("%ISSTATIC%", "static")
-        res = res.replace("%MTHDNAME%", method.name)
-        res = res.replace("%nextCaseVar%", str(nextCase))
-        res = res.replace("%WHILESTMT%", whileStmt.formatter())
-
-        with open(f"{method.scope}.java", "w") as f:
-            f.write(res)
+    def genObfuscatedBody(self, nextCase, whileStmt, declsList, indent):
+        # the new body of the method, from '{' to '}': the hoisted declarations, the case variable
+        # and the dispatcher loop. indent is the column of the method declaration.
+        lines = ["{"]
+        for decl in declsList:
+            formatStmt(decl, indent + 4, lines)
+        formatStmt(nextCase, indent + 4, lines)
+        formatStmt(whileStmt, indent + 4, lines)
+        lines.append(" " * indent + "}")
+        return "\n".join(lines)
 
     def extractVariableDeclarations(self, s):
         declsList = []
@@ -195,14 +359,14 @@ class SourceLevelCFG:
             for index, stmt in enumerate(mapCopy):
                 if type(stmt) == DeclStmt:
 
-                    declsMap[stmt.field.name] = stmt.field.name + "_" + stmt.field.scope
+                    declsMap[stmt.field.name] = f"{stmt.field.name}_{stmt.field.scope}"
 
                     if stmt.field.type_ == "int":
                         declsList.append(DeclStmt(
                             Pos(0, 0),
                             Field(
                                 Pos(0, 0),
-                                stmt.field.name + "_" + stmt.field.scope,
+                                f"{stmt.field.name}_{stmt.field.scope}",
                                 stmt.field.type_,
                                 stmt.field.kind,
                                 "0"
@@ -213,7 +377,7 @@ class SourceLevelCFG:
                             Pos(0, 0),
                             Field(
                                 Pos(0, 0),
-                                stmt.field.name + "_" + stmt.field.scope,
+                                f"{stmt.field.name}_{stmt.field.scope}",
                                 stmt.field.type_,
                                 stmt.field.kind,
                                 "0.0"
@@ -224,7 +388,7 @@ class SourceLevelCFG:
                             Pos(0, 0),
                             Field(
                                 Pos(0, 0),
-                                stmt.field.name + "_" + stmt.field.scope,
+                                f"{stmt.field.name}_{stmt.field.scope}",
                                 stmt.field.type_,
                                 stmt.field.kind,
                                 "0.0"
@@ -235,10 +399,10 @@ class SourceLevelCFG:
                             Pos(0, 0),
                             Field(
                                 Pos(0, 0),
-                                stmt.field.name + "_" + stmt.field.scope,
+                                f"{stmt.field.name}_{stmt.field.scope}",
                                 stmt.field.type_,
                                 stmt.field.kind,
-                                "''"
+                                "'\\0'"
                             )
                         ))
                     elif stmt.field.type_ == "boolean":
@@ -246,7 +410,7 @@ class SourceLevelCFG:
                             Pos(0, 0),
                             Field(
                                 Pos(0, 0),
-                                stmt.field.name + "_" + stmt.field.scope,
+                                f"{stmt.field.name}_{stmt.field.scope}",
                                 stmt.field.type_,
                                 stmt.field.kind,
                                 "false"
@@ -257,7 +421,7 @@ class SourceLevelCFG:
                             Pos(0, 0),
                             Field(
                                 Pos(0, 0),
-                                stmt.field.name + "_" + stmt.field.scope,
+                                f"{stmt.field.name}_{stmt.field.scope}",
                                 stmt.field.type_,
                                 stmt.field.kind,
                                 "null"
@@ -265,9 +429,12 @@ class SourceLevelCFG:
                         ))
 
                     if stmt.field.expr == None:
-                        del self.basicBlocks[node].stmts[index]
+                        # removed after the loop, deleting it here would shift the indexes of the next statements
+                        self.basicBlocks[node].stmts[index] = None
                     else:
-                        if stmt.field.type_ not in ["int", "float", "double", "char", "boolean", "String"]:
+                        # an array initializer is only allowed in a declaration, the assignment needs new T[] in front
+                        # of it. any other initializer is assigned as it is (it's already a whole expression).
+                        if str(stmt.field.expr).startswith("{"):
                             stmt.field.expr = "new " + stmt.field.type_ + str(stmt.field.expr)
 
                         self.basicBlocks[node].stmts[index] = ExpressionStmt(
@@ -280,15 +447,38 @@ class SourceLevelCFG:
                             )
                         )
 
+            self.basicBlocks[node].stmts = [stmt for stmt in self.basicBlocks[node].stmts if stmt is not None]
+
         return declsList, declsMap
 
     def fixVariablesInExprs(self, s, declsMap):
+        if not declsMap:
+            return
+
+        # one pattern for all the declared names of the method, so every name is renamed in a single pass.
+        # string and char literals are matched as a whole and kept as they are, and a name is only renamed
+        # as a whole identifier that is not a member (after a '.'), the longest names first (an
+        # alternation takes the first alternative that matches).
+        names = sorted(declsMap, key=len, reverse=True)
+        pattern = re.compile(
+            r'"(?:\\.|[^"\\])*"|' + r"'(?:\\.|[^'\\])*'|" +
+            rf"(?<![\w$.])({'|'.join(map(re.escape, names))})(?![\w$])"
+        )
+
+        def rename(match):
+            if match.group(1) is None:
+                return match.group(0)
+            return declsMap[match.group(1)]
+
         def replaceName(expr):
-            result = str(expr)
-            for k in declsMap:
-                pattern = f"(?<![0-9a-zA-Z]){k}(?![0-9a-zA-Z])"
-                result = re.sub(pattern, declsMap[k], result)
-            return result
+            # the names in a nested expression are renamed in place, only the text parts of the
+            # expressions (identifiers, literals, unparsed subexpressions) go through the pattern
+            if expr is None:
+                return None
+            if type(expr) in (UnaryExpr, AssignExpr, CallExpr, BinaryExpr, ConditionalExpr, MallocExpr, CastExpr):
+                handleExpr(expr)
+                return expr
+            return pattern.sub(rename, str(expr))
 
         def handleExpr(expr):
             if type(expr) == UnaryExpr:
@@ -311,6 +501,10 @@ class SourceLevelCFG:
                 for index, arg in enumerate(expr.args):
                     expr.args[index] = replaceName(arg)
             elif type(expr) == BinaryExpr:
+                # a left-nested chain (like a long string concatenation) is renamed in a loop, not recursively
+                while type(expr.lhs) == BinaryExpr:
+                    expr.rhs = replaceName(expr.rhs)
+                    expr = expr.lhs
                 expr.lhs = replaceName(expr.lhs)
                 expr.rhs = replaceName(expr.rhs)
 
@@ -344,13 +538,6 @@ class SourceLevelCFG:
                     handleExpr(stmt)
 
     def constructSwitchCFG(self, s):
-        def genCaseKey(key):
-            value = 0
-            for i in range(16):
-                bit = (key >> i) & 1
-                value |= bit << (15 - i)
-            return value
-
         global endNode
         g = nx.DiGraph()
 
@@ -403,15 +590,10 @@ class SourceLevelCFG:
             nextCase.name
         )
 
-        casesEncrypted = {}
+        casesEncrypted = genCaseKeys(self.random, list(s.nodes), self.caseKeyBits)
 
         startcase = None
 
-        for node in list(s.nodes):
-            if casesEncrypted.get(node) == None:
-                rand = random.randint(156666, 999999)
-                casesEncrypted[node] = [rand, genCaseKey(rand)]
-
         for node in list(s.nodes):
             if node == 0:
                 continue
@@ -429,16 +611,16 @@ class SourceLevelCFG:
                 gCopy = self.CFG.copy()
                 for e in gCopy.out_edges(node):
                     if e[1] == list(s.nodes)[-1] and gCopy.get_edge_data(e[0], e[1])["label"] == "true":
-                        trueRandomNumber = -random.randint(77, 65535)
+                        trueRandomNumber = -self.random.randint(77, 65535)
                     elif e[1] == list(s.nodes)[-1] and gCopy.get_edge_data(e[0], e[1])["label"] == "false":
-                        falseRandomNumber = -random.randint(77, 65535)
+                        falseRandomNumber = -self.random.randint(77, 65535)
                     elif gCopy.get_edge_data(e[0], e[1])["label"] == "true":
                         trueRandomNumber = casesEncrypted[e[1]][0]
                     elif gCopy.get_edge_data(e[0], e[1])["label"] == "false":
                         falseRandomNumber = casesEncrypted[e[1]][0]
                     else:
-                        trueRandomNumber = -random.randint(77, 65535)
-                        falseRandomNumber = -random.randint(77, 65535)
+                        trueRandomNumber = -self.random.randint(77, 65535)
+                        falseRandomNumber = -self.random.randint(77, 65535)
 
                 ifStmt = IfStmt(
                     Pos(0, 0),
@@ -451,7 +633,7 @@ class SourceLevelCFG:
 
                 ce = CallExpr(
                     Pos(0, 0),
-                    "Dispatcher",
+                    self.dispatcher,
                     "getNextCase",
                 )
                 ce.args = [str(trueRandomNumber)]
@@ -470,7 +652,7 @@ class SourceLevelCFG:
 
                 ce2 = CallExpr(
                     Pos(0, 0),
-                    "Dispatcher",
+                    self.dispatcher,
                     "getNextCase",
                 )
                 ce2.args = [str(falseRandomNumber)]
@@ -513,20 +695,19 @@ class SourceLevelCFG:
                 gCopy = self.CFG.copy()
                 for e in gCopy.out_edges(node):
                     if e[1] == list(s.nodes)[-1]:
-                        nextRandomNumber = -random.randint(77, 65535)
+                        nextRandomNumber = -self.random.randint(77, 65535)
                     else:
                         nextRandomNumber = casesEncrypted[e[1]][0]
 
                 se.caseBlocks[casesEncrypted[node][1]] = BlockStmt(
                     Pos(0, 0)
                 )
-                se.caseBlocks[casesEncrypted[node][1]].attr = self.basicBlocks[node].attr
 
                 se.caseBlocks[casesEncrypted[node][1]].body.extend(self.basicBlocks[node].stmts)
 
                 ce = CallExpr(
                     Pos(0, 0),
-                    "Dispatcher",
+                    self.dispatcher,
                     "getNextCase",
                 )
                 ce.args = [str(nextRandomNumber)]
@@ -555,7 +736,7 @@ class SourceLevelCFG:
                 bIndex += 1
 
         l = list(se.caseBlocks.items())
-        random.shuffle(l)
+        self.random.shuffle(l)
         se.caseBlocks = dict(l)
 
         whileStmt.bodyBlock.body.append(se)
@@ -1186,6 +1367,8 @@ class SourceLevelCFG:
         self.CFG = self.removeEmptyBlocks(self.CFG)
 
     def drawCFG(self, method, ext):
+        import graphviz as gv
+
         gd = gv.Digraph(format="pdf", node_attr={"shape": "none"}, strict=True, graph_attr={"rankdir": "TD"})
 
         gd.node(f'package: {self.ast.package}\nclass: {method.scope}\nmethod: {method.name}', style="filled",
@@ -1224,3 +1407,212 @@ class SourceLevelCFG:
                 gd.edge(str(edgeStartNode), str(edgeEndNode), tailport="s")
 
         gd.render(f"./{method.name}_{ext}.gv", view=True)
+
+
+# the case key of a random number is its low bits reversed (see genCaseKeys), a negative number
+# leaves the dispatcher loop
+DISPATCHER_SOURCE = """public class {name} {{
+    public static int getNextCase(int key) {{
+        if (key < 0) {{
+            return key;
+        }}
+        return Integer.reverse(key) >>> {shift};
+    }}
+}}
+"""
+
+
+def dispatcherClassName(caseKeyBits):
+    # the class decoding the case keys of a width: the outputs of runs with different widths never share a decoder
+    return f"Dispatcher{caseKeyBits}"
+
+
+class FlatteningListener(ASTListener):
+    # the AST only, the obfuscator generates its own CFGs
+    def exitCompilationUnit(self, ctx):
+        pass
+
+
+def spliceBodies(text, tokens, flattened):
+    # the source text with the body of every flattened method (the block that starts at the position of
+    # its body block) replaced by its new body, everything else of the file is kept as it is
+    starts = {(t.line, t.column): i for i, t in enumerate(tokens) if t.type == Java20Lexer.LBRACE}
+    bodies = []
+    for method, body in flattened:
+        i = starts.get((method.bodyBlock.pos.line, method.bodyBlock.pos.column))
+        close = matchingBrace(tokens, i) if i is not None else None
+        if close is None:
+            raise ValueError(f"can't find the body of method {method.name}")
+        bodies.append((tokens[i].start, tokens[close].stop, body))
+
+    parts = []
+    previous = 0
+    for start, stop, body in sorted(bodies, key=lambda b: b[0]):
+        parts.append(text[previous:start])
+        parts.append(body)
+        previous = stop + 1
+    parts.append(text[previous:])
+    return "".join(parts)
+
+
+def checkFlattenedBody(method, body):
+    # raises a ValueError for the constructs of a flattened body that parse but don't compile: a part of an
+    # expression the AST doesn't model (printed as None) or a statement after a return
+    tokens = [t for t in Java20Lexer(InputStream(body)).getAllTokens() if t.channel == Token.DEFAULT_CHANNEL]
+    for i, token in enumerate(tokens):
+        if token.type == Java20Lexer.Identifier and token.text == "None":
+            raise ValueError(f"unmodeled expression in the flattened body of method {method.name}")
+        if token.type == Java20Lexer.RETURN:
+            end = next(j for j in range(i, len(tokens)) if tokens[j].type == Java20Lexer.SEMI)
+            if end + 1 < len(tokens) and tokens[end + 1].type != Java20Lexer.RBRACE:
+                raise ValueError(f"unreachable statement in the flattened body of method {method.name}")
+
+
+def obfuscateFile(filePath, outputPath, twoStage=False, caseKeyBits=DEFAULT_CASE_KEY_BITS, seed=None):
+    # runs inside a worker process: flattens the methods of a java file and writes the result to outputPath.
+    # a file that can't be parsed, or has no method to flatten, is copied as it is. returns a status record.
+    # the flattened file is parsed again (and its new bodies checked, see checkFlattenedBody): if it fails,
+    # the file is copied as it is too.
+    # seed: the seed of the case keys of the file (see SourceLevelCFG), None for random ones
+    start = time.perf_counter()
+    status = {"file": str(filePath), "ok": True, "error": "", "methods": 0, "flattened": 0, "package": None}
+    with open(filePath, encoding="utf8", newline="") as f:
+        text = f.read()
+    result = text
+    try:
+        # the generated dispatcher would replace a class of the sources with the same name
+        dispatcher = dispatcherClassName(caseKeyBits)
+        if os.path.exists(os.path.join(os.path.dirname(filePath), f"{dispatcher}.java")):
+            raise ValueError(f"the package already has a class {dispatcher}")
+        worker = getParserWorker(twoStage)
+        parseTree = worker.parseText(text)
+        listener = FlatteningListener(os.devnull, OutputMode.NONE)
+        IterativeParseTreeWalker().walk(listener, parseTree)
+
+        obfuscator = SourceLevelCFG(listener.ast, draw=False, caseKeyBits=caseKeyBits, seed=seed)
+        obfuscator.Gen()
+        status["methods"] = sum(1 for d in listener.ast.decls if type(d) == Method)
+        if obfuscator.flattened:
+            tokens = [t for t in worker.tokenStream.tokens if t.channel == Token.DEFAULT_CHANNEL]
+            flattenedText = spliceBodies(text, tokens, obfuscator.flattened)
+            for method, body in obfuscator.flattened:
+                checkFlattenedBody(method, body)
+            worker.parseText(flattenedText)
+            result = flattenedText
+            status["flattened"] = len(obfuscator.flattened)
+            status["package"] = listener.ast.package
+    except Exception as e:
+        status["ok"] = False
+        status["error"] = repr(e)
+
+    os.makedirs(os.path.dirname(outputPath) or ".", exist_ok=True)
+    with open(outputPath, "w", encoding="utf8", newline="") as f:
+        f.write(result)
+    status["bytes"] = len(text)
+    status["elapsed"] = time.perf_counter() - start
+    return status
+
+
+def writeDispatcher(directory, package, caseKeyBits=DEFAULT_CASE_KEY_BITS):
+    # the dispatcher class of the flattened methods of a package. it is always written: a dispatcher left by
+    # a run with another key width would decode keys that match no case, and the dispatcher loop never ends.
+    name = dispatcherClassName(caseKeyBits)
+    with open(os.path.join(directory, f"{name}.java"), "w", encoding="utf8") as f:
+        if package:
+            f.write(f"package {package};\n\n")
+        f.write(DISPATCHER_SOURCE.format(name=name, shift=32 - caseKeyBits))
+
+
+def iterJavaFiles(sourceDir, destinationDir):
+    # (source file, output file) of every .java file of the source tree, the output tree mirrors it
+    for root, dirs, files in os.walk(sourceDir):
+        for file in sorted(files):
+            if file.endswith(".java"):
+                filePath = Path(root) / file
+                yield filePath, Path(destinationDir) / filePath.relative_to(sourceDir)
+
+
+def obfuscateDirectory(sourceDir, destinationDir, workers=None, startMethod=None, maxInFlight=None, twoStage=False,
+                       caseKeyBits=DEFAULT_CASE_KEY_BITS, seed=None):
+    # flattens every .java file of sourceDir into destinationDir in a pool of worker processes, like
+    # generate_directory_cfg in main.py. returns the status records of the files.
+    # with a seed, every file gets its own seed (the seed and its path in the tree): the output of a file
+    # doesn't depend on the worker that flattens it or on the other files.
+    workers = workers or os.cpu_count() or 1
+    maxInFlight = maxInFlight or workers * 4
+    statuses = []
+    pending = set()
+
+    def collect(done):
+        for future in done:
+            status = future.result()
+            if not status["ok"]:
+                print(f"{timestamp()} error: {status['error']} file: '{Path(status['file']).name}' copied as it is")
+            statuses.append(status)
+
+    context = poolContext(startMethod or defaultStartMethod())
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        for filePath, outputPath in iterJavaFiles(sourceDir, destinationDir):
+            fileSeed = None if seed is None else f"{seed}:{filePath.relative_to(sourceDir).as_posix()}"
+            pending.add(executor.submit(obfuscateFile, str(filePath), str(outputPath), twoStage, caseKeyBits,
+                                        fileSeed))
+            if len(pending) >= maxInFlight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+
+        done, pending = wait(pending)
+        collect(done)
+
+    # one dispatcher per output directory with a flattened method (it is used unqualified)
+    packages = {}
+    for status in statuses:
+        if status["flattened"]:
+            packages[os.path.dirname(Path(destinationDir) / Path(status["file"]).relative_to(sourceDir))] = \
+                status["package"]
+    for directory, package in packages.items():
+        writeDispatcher(directory, package, caseKeyBits)
+
+    return statuses
+
+
+def main(argv=None):
+    argParser = argparse.ArgumentParser(description="Flatten the control flow of the methods of every .java file of a "
+                                                    "source tree into a mirrored output tree.")
+    argParser.add_argument("source", help="a directory containing .java files")
+    argParser.add_argument("-o", "--output", required=True, help="output directory")
+    argParser.add_argument("-j", "--workers", type=int, default=None,
+                           help="number of worker processes (default: cpu count)")
+    argParser.add_argument("--start-method", choices=mp.get_all_start_methods(), default=None,
+                           help="multiprocessing start method (default: forkserver when available)")
+    argParser.add_argument("--max-in-flight", type=int, default=None,
+                           help="maximum number of files queued in the worker pool (default: 4 * workers)")
+    argParser.add_argument("--sll", action="store_true",
+                           help="parse with SLL prediction first, re-parse with full LL only if it fails")
+    argParser.add_argument("--case-key-bits", type=int, default=DEFAULT_CASE_KEY_BITS,
+                           help=f"width of the case keys of the dispatcher switches, 1 to {MAX_CASE_KEY_BITS} "
+                                f"(default: {DEFAULT_CASE_KEY_BITS}); a method can't have more basic blocks than "
+                                f"keys of that width")
+    argParser.add_argument("--seed", default=None,
+                           help="seed of the case keys: the same sources and seed always give the same output "
+                                "(default: random)")
+    args = argParser.parse_args(argv)
+    if not 1 <= args.case_key_bits <= MAX_CASE_KEY_BITS:
+        argParser.error(f"--case-key-bits must be between 1 and {MAX_CASE_KEY_BITS}")
+
+    start = time.perf_counter()
+    statuses = obfuscateDirectory(args.source, args.output, args.workers, args.start_method, args.max_in_flight,
+                                  args.sll, args.case_key_bits, args.seed)
+    elapsed = time.perf_counter() - start
+
+    failed = sum(1 for s in statuses if not s["ok"])
+    methods = sum(s["methods"] for s in statuses)
+    flattened = sum(s["flattened"] for s in statuses)
+    sourceBytes = sum(s["bytes"] for s in statuses)
+    print(f"{timestamp()} {len(statuses)} files ({failed} failed), {flattened} of {methods} methods flattened "
+          f"in {elapsed:.1f} s: {len(statuses) / max(elapsed, 1e-9):.2f} files/s, "
+          f"{flattened / max(elapsed, 1e-9):.2f} methods/s, {sourceBytes / 1024 / max(elapsed, 1e-9):.1f} KiB/s")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())